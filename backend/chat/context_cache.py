@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from google.genai import types
+
+from .token_budget import estimate_tokens
+
+
+class CacheEntry(NamedTuple):
+    name: str
+    model: str
+    tokens: int
+    expires_at: float
+
+
+class VertexContextCacheBackend:
+    """Creates and deletes Vertex AI cached contents through the GenAI client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, model, contents, ttl_seconds, display_name):
+        cache = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[contents],
+                ttl=f"{int(ttl_seconds)}s",
+                display_name=display_name,
+            ),
+        )
+        return cache.name
+
+    async def delete(self, name):
+        await self.client.aio.caches.delete(name=name)
+
+
+class LocalContextCacheBackend:
+    """
+    In-process stand-in for the Vertex backend, for tests and local runs.
+
+    Stores the cached text under a generated name and counts calls, so the
+    manager can be exercised without network access.
+    """
+
+    def __init__(self):
+        self.contents = {}
+        self.created = 0
+        self.deleted = 0
+        self._ids = itertools.count(1)
+
+    async def create(self, model, contents, ttl_seconds, display_name):
+        name = f"local/{model}/{next(self._ids)}"
+        self.contents[name] = contents
+        self.created += 1
+        return name
+
+    async def delete(self, name):
+        self.contents.pop(name, None)
+        self.deleted += 1
+
+
+class ContextCacheManager:
+    """
+    Reuses cached model context for repeated reference markdown.
+
+    Entries are keyed by a hash of the model and the exact markdown, so the
+    retrieved references of a sub-batch are sent once per model and reused
+    by its top-up calls and by later papers that retrieve the same pages. Expiry is tracked locally
+    from the TTL given at creation (minus ``refresh_margin`` so a cache is
+    never used right before the server drops it), and the least recently
+    used entries beyond ``max_entries`` are deleted remotely.
+
+    ``get`` returns None whenever caching does not apply (no backend, text
+    outside the token limits, or a failed create); callers then send the
+    markdown inline as usual.
+    """
+
+    def __init__(self, backend=None, ttl_seconds=3600, min_tokens=4096, max_tokens=24000, max_entries=64, refresh_margin=60):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self._entries = OrderedDict()
+        self._creating = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.creates = 0
+        self.failures = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model, markdown):
+        return hashlib.sha256(f"{model}\0{markdown}".encode("utf-8")).hexdigest()
+
+    def applies(self, markdown):
+        return self.backend is not None and self.min_tokens <= estimate_tokens(markdown) <= self.max_tokens
+
+    async def get(self, model, markdown):
+        """
+        Args:
+            model (str): Model the cached content is created for.
+            markdown (str): Reference text to cache.
+
+        Returns:
+            str: Cached content name to pass as ``cached_content``, or None.
+        """
+        if not markdown or not self.applies(markdown):
+            return None
+
+        key = self.key(model, markdown)
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry.name
+
+        # Concurrent sections asking for the same markdown share one create
+        creating = self._creating.get(key)
+        if creating is None:
+            creating = self._creating[key] = asyncio.ensure_future(self._create(key, model, markdown))
+            creating.add_done_callback(lambda _: self._creating.pop(key, None))
+        entry = await asyncio.shield(creating)
+        return entry.name if entry is not None else None
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at - self.refresh_margin <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    async def _create(self, key, model, markdown):
+        try:
+            name = await self.backend.create(model, markdown, self.ttl_seconds, display_name=f"qgenie-{key[:16]}")
+        except Exception as e:
+            print(f"Could not create context cache: {e}")
+            with self._lock:
+                self.failures += 1
+            return None
+
+        entry = CacheEntry(name, model, estimate_tokens(markdown), time.time() + self.ttl_seconds)
+        with self._lock:
+            self.creates += 1
+            self._entries[key] = entry
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+                self.evictions += 1
+        for stale in evicted:
+            await self._delete(stale.name)
+        return entry
+
+    async def _delete(self, name):
+        try:
+            await self.backend.delete(name)
+        except Exception as e:
+            print(f"Could not delete context cache {name}: {e}")
+
+    async def invalidate(self, name):
+        """Forget an entry whose cached content the server no longer accepts, and delete it there."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[key]
+        # Still billed until its TTL if it was rejected for any other reason
+        await self._delete(name)
+
+    async def clear(self):
+        """Delete every cached content created by this process, e.g. on shutdown."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            await self._delete(entry.name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.backend is not None,
+                "entries": len(self._entries),
+                "cached_tokens": sum(entry.tokens for entry in self._entries.values()),
+                "hits": self.hits,
+                "creates": self.creates,
+                "failures": self.failures,
+                "evictions": self.evictions,
+            }
+
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# The backend is attached where the GenAI client is created (prompt_processor)
+context_cache = ContextCacheManager(
+    ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600")),
+    min_tokens=int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "4096")),
+    max_tokens=int(os.getenv("CONTEXT_CACHE_MAX_TOKENS", "24000")),
+    max_entries=int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "64")),
+)
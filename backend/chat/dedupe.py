@@ -0,0 +1,187 @@
+import itertools
+import re
+import zlib
+
+import numpy as np
+
+from .text_processing import tokenize
+
+
+_MARKS = re.compile(r'\[Marks \d+\]')
+
+# Questions whose shingle sets overlap at least this much are treated as the same question
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Largest prime below 2**32, so (a * x + b) of 32-bit hashes fits in uint64
+_PRIME = 4294967291
+
+
+def question_text(question):
+    """Question text plus its option values, without the marks tag."""
+    text = _MARKS.sub("", str(question.get("question") or ""))
+    options = question.get("options")
+    if isinstance(options, dict):
+        text += " " + " ".join(str(value) for _, value in sorted(options.items()))
+    return text
+
+
+def shingles(text, k=3):
+    tokens = tokenize(text)
+    if len(tokens) < k:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def similarity(first, second):
+    """Jaccard similarity of two shingle sets."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    """MinHash signatures of shingle sets, from ``num_perm`` universal hash functions."""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set),
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+
+_default_hasher = MinHasher()
+
+
+class LSHIndex:
+    """
+    Near-duplicate index over questions.
+
+    Each question's shingles are MinHashed and the signature is split into
+    ``bands``; questions sharing any band land in the same bucket and become
+    candidates, which are then confirmed with the exact Jaccard similarity.
+    With 16 bands of 4 rows, pairs at 0.8 similarity are found with
+    probability > 0.999 while lookups touch only a handful of candidates,
+    however large the index grows.
+
+    Questions without any usable words cannot be compared and are never
+    reported as duplicates.
+    """
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, bands=16, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or _default_hasher
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._shingles = {}
+        self._keys = itertools.count()
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _prepare(self, question):
+        signature_shingles = shingles(question_text(question))
+        if not signature_shingles:
+            return signature_shingles, None
+        return signature_shingles, self._band_keys(self.hasher.signature(signature_shingles))
+
+    def _find(self, signature_shingles, band_keys):
+        if band_keys is None:
+            return None
+        checked = set()
+        for buckets, band_key in zip(self._buckets, band_keys):
+            for key in buckets.get(band_key, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                if similarity(signature_shingles, self._shingles[key]) >= self.threshold:
+                    return key
+        return None
+
+    def _insert(self, key, signature_shingles, band_keys):
+        if band_keys is None:
+            return
+        self._shingles[key] = signature_shingles
+        for buckets, band_key in zip(self._buckets, band_keys):
+            buckets.setdefault(band_key, []).append(key)
+
+    def find(self, question):
+        """Key of an indexed near-duplicate of ``question``, or None."""
+        return self._find(*self._prepare(question))
+
+    def insert(self, question, key=None):
+        """Index ``question`` under ``key`` (a generated one by default) and return the key."""
+        key = next(self._keys) if key is None else key
+        self._insert(key, *self._prepare(question))
+        return key
+
+    def add(self, question, key=None):
+        """
+        Index ``question`` unless it near-duplicates an indexed one.
+
+        Returns:
+            bool: True if it was new and has been added.
+        """
+        signature_shingles, band_keys = self._prepare(question)
+        if self._find(signature_shingles, band_keys) is not None:
+            return False
+        self._insert(next(self._keys) if key is None else key, signature_shingles, band_keys)
+        return True
+
+    def __len__(self):
+        return len(self._shingles)
+
+
+def dedupe_questions(questions, existing=(), threshold=NEAR_DUPLICATE_THRESHOLD, index=None):
+    """
+    Drop near-duplicate questions.
+
+    Args:
+        questions (list[dict]): Candidate questions, in priority order.
+        existing (list[dict]): Questions already accepted; candidates similar to
+            any of them are dropped too.
+        threshold (float): Jaccard similarity at which two questions are duplicates.
+        index (LSHIndex): Index to check against and add the accepted
+            candidates to, for callers deduping several batches in turn.
+
+    Returns:
+        list[dict]: The candidates that are not near-duplicates.
+    """
+    if index is None:
+        index = LSHIndex(threshold)
+    for question in existing:
+        index.insert(question)
+
+    unique = []
+    for question in questions:
+        if not isinstance(question, dict) or not question.get("question"):
+            continue
+        if index.add(question):
+            unique.append(question)
+    return unique
+
+
+def dedupe_paper(master_json, existing=(), threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Drop near-duplicates across all sections of a paper, keeping the first
+    occurrence in section order.
+
+    Args:
+        master_json (list[list[dict]]): Questions per section.
+        existing (list[dict]): Questions that must not be repeated either.
+
+    Returns:
+        list[list[dict]]: The sections without duplicates; a section may end up empty.
+    """
+    index = LSHIndex(threshold)
+    for question in existing:
+        index.insert(question)
+    return [dedupe_questions(section or [], index=index) for section in master_json]
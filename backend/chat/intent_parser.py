@@ -0,0 +1,216 @@
+import threading
+
+from lark import Lark, Token, Tree
+from lark.exceptions import LarkError
+
+from .query_cache import normalize_query
+
+
+# Combinations offered by class_subject_prompt, as (standard, subject)
+SUPPORTED_COMBINATIONS = {
+    ("CLASS 10", "MATHS"),
+    ("CLASS 12", "PHYSICS"),
+}
+
+_ROMAN = {"ix": 9, "x": 10, "xi": 11, "xii": 12}
+
+# Words that carry no meaning for either extraction. Any word outside the
+# grammar makes the parse fail, so unusual phrasing always reaches the LLM;
+# "total"/"overall" marks are left out on purpose, they are not per question.
+_FILLER = r"""/(i|im|am|we|want|need|needs|require|would|like|a|an|the|create|make|generate|prepare|give|me|us|get|build|draft|set|up|paper|papers|exam|test|sample|mock|quiz|worksheet|for|of|on|in|to|with|and|also|add|plus|include|including|please|pls|kindly|can|could|you|my|our|students|student|interested|is|are|be|it|each|carrying|having|level|difficulty|hi|hello|hey|subject|question|questions|qs)\b/"""
+
+CLASS_SUBJECT_GRAMMAR = r"""
+    start: item*
+    ?item: standard | subject | FILLER | NUMBER | MARK
+
+    standard: CLASS (NUMBER | ROMAN) ORDINAL_SUFFIX?
+            | NUMBER ORDINAL_SUFFIX CLASS?
+    subject: MATHS | PHYSICS | OTHER_SUBJECT
+
+    CLASS.3: /(class|std|standard|grade)\b/
+    ROMAN.3: /(xii|xi|ix|x)\b/
+    ORDINAL_SUFFIX.3: /(st|nd|rd|th)\b/
+    MATHS.3: /(maths|math|mathematics)\b/
+    PHYSICS.3: /physics\b/
+    OTHER_SUBJECT.3: /(chemistry|biology|science|english|hindi|sanskrit|history|geography|civics|economics|accountancy|commerce|computer|social|studies)\b/
+    MARK.2: /marks?\b/
+    FILLER.1: """ + _FILLER + r"""
+    NUMBER: /\d+(\.\d+)?/
+
+    %ignore " "
+"""
+
+EXAM_SPECIFICATIONS_GRAMMAR = r"""
+    start: item*
+    ?item: spec | marks | FILLER | QUESTION_WORD
+
+    spec: NUMBER descriptor+ QUESTION_WORD?
+    ?descriptor: DIFFICULTY | mcq | subjective
+    mcq: MCQ | "multiple" "choice"
+    subjective: SUBJECTIVE | ANSWER_LENGTH ANSWER_WORD
+    marks: NUMBER MARK
+
+    DIFFICULTY.3: /(easy|medium|hard)\b/
+    MCQ.3: /mcqs?\b/
+    SUBJECTIVE.3: /(subjective|descriptive)\b/
+    ANSWER_LENGTH.3: /(short|long)\b/
+    ANSWER_WORD.3: /answers?\b/
+    QUESTION_WORD.2: /(questions?|qs)\b/
+    MARK.2: /marks?\b/
+    FILLER.1: """ + _FILLER.replace("|question|questions|qs", "") + r"""
+    NUMBER: /\d+(\.\d+)?/
+
+    %ignore " "
+"""
+
+_class_subject_parser = Lark(CLASS_SUBJECT_GRAMMAR, parser="lalr")
+_exam_specifications_parser = Lark(EXAM_SPECIFICATIONS_GRAMMAR, parser="lalr")
+
+_stats_lock = threading.Lock()
+_stats = {"class_subject": {"parsed": 0, "fallback": 0}, "exam_specifications": {"parsed": 0, "fallback": 0}}
+
+
+def _count(name, parsed):
+    with _stats_lock:
+        _stats[name]["parsed" if parsed else "fallback"] += 1
+
+
+def stats():
+    """How often each extraction was answered locally versus sent to the LLM."""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def _number(token):
+    """Integer value of a NUMBER token, or None for a fraction such as "2.5"."""
+    value = float(token)
+    return int(value) if value.is_integer() else None
+
+
+def _parse(parser, query):
+    normalized = normalize_query(query)
+    if not normalized:
+        return None
+    try:
+        return parser.parse(normalized)
+    except LarkError:
+        return None
+
+
+def _class_subject(tree):
+    standards = set()
+    subjects = set()
+    for node in tree.children:
+        if not isinstance(node, Tree):
+            continue
+        if node.data == "standard":
+            value = next(child for child in node.children if child.type in ("NUMBER", "ROMAN"))
+            number = _ROMAN[value] if value.type == "ROMAN" else _number(value)
+            if number is None:
+                return None
+            standards.add(number)
+        elif node.data == "subject":
+            token = node.children[0]
+            subjects.add(token.type if token.type in ("MATHS", "PHYSICS") else str(token))
+
+    # Only the unambiguous "one class, at most one subject" case is handled locally
+    if len(standards) != 1 or len(subjects) > 1:
+        return None
+
+    standard = f"CLASS {standards.pop()}"
+    subject = subjects.pop() if subjects else ""
+
+    if not any(standard == supported for supported, _ in SUPPORTED_COMBINATIONS):
+        standard, subject = "", ""
+    elif (standard, subject) not in SUPPORTED_COMBINATIONS:
+        subject = ""
+
+    return {
+        "standard": {"id": standard, "name": standard},
+        "subject": {"id": subject, "name": subject},
+    }
+
+
+def parse_class_subject(user_query):
+    """
+    Local fast path for ``class_subject_prompt``.
+
+    Returns:
+        dict: The same JSON shape the prompt produces, or None when the query
+        is not handled confidently and the LLM has to decide.
+    """
+    tree = _parse(_class_subject_parser, user_query)
+    result = _class_subject(tree) if tree is not None else None
+    _count("class_subject", result is not None)
+    return result
+
+
+def _exam_specifications(tree):
+    specs = []
+    leading_marks = None
+    for node in tree.children:
+        if not isinstance(node, Tree):
+            continue
+        if node.data == "spec":
+            spec = {"difficulty": None, "type": None, "questions": _number(node.children[0]), "marks": None}
+            for child in node.children[1:]:
+                if isinstance(child, Token) and child.type == "DIFFICULTY":
+                    key, value = "difficulty", str(child)
+                elif isinstance(child, Tree):
+                    key, value = "type", "MCQ" if child.data == "mcq" else "Subjective"
+                else:
+                    continue
+                if spec[key] is not None:
+                    return None
+                spec[key] = value
+            if spec["difficulty"] is None or spec["questions"] is None or spec["questions"] <= 0:
+                return None
+            specs.append(spec)
+        elif node.data == "marks":
+            marks = _number(node.children[0])
+            if marks is None:
+                return None
+            if specs and specs[-1]["marks"] is None:
+                specs[-1]["marks"] = marks
+            elif not specs and leading_marks is None:
+                leading_marks = marks
+            else:
+                return None
+
+    if not specs:
+        return None
+    if leading_marks is not None:
+        if specs[0]["marks"] is not None:
+            return None
+        specs[0]["marks"] = leading_marks
+    # "3 easy and 2 hard mcqs of 1 mark each": the type and the marks may
+    # belong to the last spec or to all of them
+    for key in ("type", "marks"):
+        if len(specs) > 1 and any(spec[key] is not None for spec in specs) \
+                and any(spec[key] is None for spec in specs):
+            return None
+
+    return [
+        {
+            "difficulty": spec["difficulty"],
+            "type": spec["type"] or "",
+            "questions": spec["questions"],
+            "marks": spec["marks"] or 0,
+        }
+        for spec in specs
+    ]
+
+
+def parse_exam_specifications(user_query):
+    """
+    Local fast path for ``extract_exam_specifications_prompt``, e.g.
+    "3 medium subjective questions of 5 marks".
+
+    Returns:
+        list[dict]: The same JSON shape the prompt produces, or None when the
+        query is not handled confidently and the LLM has to decide.
+    """
+    tree = _parse(_exam_specifications_parser, user_query)
+    result = _exam_specifications(tree) if tree is not None else None
+    _count("exam_specifications", result is not None)
+    return result
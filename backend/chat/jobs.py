@@ -0,0 +1,306 @@
+import asyncio
+import copy
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, or_
+
+from db.database import get_db
+from db.models import GenerationJob
+
+
+# Pipeline stages reported on every job, in execution order
+STAGES = ["retrieve", "generate", "render", "upload"]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+def new_job(educator_id, request):
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "educator_id": educator_id,
+        "status": QUEUED,
+        "stage": None,
+        "progress": {stage: {"status": "pending", "started_at": None, "finished_at": None} for stage in STAGES},
+        "request": request,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class InMemoryJobBackend:
+    """Keeps jobs in process memory; they are lost on restart."""
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._jobs = {}
+
+    async def save(self, job):
+        self._jobs[job["id"]] = copy.deepcopy(job)
+        if len(self._jobs) > self.max_jobs:
+            # Forget the oldest finished jobs first
+            finished = sorted((j for j in self._jobs.values() if j["status"] in FINISHED), key=lambda j: j["updated_at"])
+            for stale in finished[:len(self._jobs) - self.max_jobs]:
+                del self._jobs[stale["id"]]
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return copy.deepcopy(job) if job else None
+
+    async def unfinished(self):
+        return []
+
+    async def claim(self, job_id, owner, lease_seconds):
+        job = self._jobs.get(job_id)
+        return job is not None and job["status"] == QUEUED
+
+    async def renew(self, job_id, owner):
+        pass
+
+
+class DatabaseJobBackend:
+    """Persists jobs in the generation_jobs table so they survive restarts and are visible to every worker."""
+
+    def _save(self, job):
+        with get_db() as db:
+            row = db.get(GenerationJob, job["id"]) or GenerationJob(id=job["id"])
+            row.educator_id = job["educator_id"]
+            row.status = job["status"]
+            row.stage = job["stage"]
+            row.progress = job["progress"]
+            row.request = job["request"]
+            row.result = job["result"]
+            row.error = job["error"]
+            db.add(row)
+
+    def _get(self, job_id):
+        with get_db() as db:
+            row = db.get(GenerationJob, job_id)
+            return self._to_dict(row) if row else None
+
+    def _unfinished(self):
+        with get_db() as db:
+            rows = db.query(GenerationJob)\
+                .filter(GenerationJob.status.in_([QUEUED, RUNNING]))\
+                .order_by(GenerationJob.created_at)\
+                .all()
+            return [self._to_dict(row) for row in rows]
+
+    def _claim(self, job_id, owner, lease_seconds):
+        # A single conditional UPDATE, so of all workers that resumed or were
+        # handed the same job exactly one gets it. Running jobs are taken
+        # over only once their owner stopped renewing the lease.
+        stale = datetime.now(timezone.utc) - timedelta(seconds=lease_seconds)
+        with get_db() as db:
+            claimed = db.query(GenerationJob)\
+                .filter(
+                    GenerationJob.id == job_id,
+                    or_(
+                        GenerationJob.status == QUEUED,
+                        and_(GenerationJob.status == RUNNING, GenerationJob.updated_at < stale),
+                    ),
+                )\
+                .update({"status": RUNNING, "owner": owner, "updated_at": func.now()}, synchronize_session=False)
+            return claimed == 1
+
+    def _renew(self, job_id, owner):
+        with get_db() as db:
+            db.query(GenerationJob)\
+                .filter(GenerationJob.id == job_id, GenerationJob.owner == owner)\
+                .update({"updated_at": func.now()}, synchronize_session=False)
+
+    @staticmethod
+    def _to_dict(row):
+        return {
+            "id": row.id,
+            "educator_id": str(row.educator_id),
+            "status": row.status,
+            "stage": row.stage,
+            "progress": row.progress,
+            "request": row.request,
+            "result": row.result,
+            "error": row.error,
+            "created_at": row.created_at.timestamp() if row.created_at else None,
+            "updated_at": row.updated_at.timestamp() if row.updated_at else None,
+        }
+
+    async def save(self, job):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def unfinished(self):
+        return await asyncio.to_thread(self._unfinished)
+
+    async def claim(self, job_id, owner, lease_seconds):
+        return await asyncio.to_thread(self._claim, job_id, owner, lease_seconds)
+
+    async def renew(self, job_id, owner):
+        await asyncio.to_thread(self._renew, job_id, owner)
+
+
+class JobManager:
+    """
+    Runs paper generation jobs on an in-process asyncio queue.
+
+    ``submit`` stores the job and returns immediately; ``workers`` background
+    tasks execute the pipeline and record per-stage progress in the backend.
+    Jobs left queued or running by a previous process are picked up again on
+    start when the backend is persistent. Every process does this, so a job
+    is claimed in the backend before it runs: only one process gets it, and
+    the owner renews its lease every ``lease_seconds / 3`` while it runs. A
+    running job whose lease expired is taken over by the next process that
+    starts.
+    """
+
+    def __init__(self, runner=None, backend=None, workers=4, lease_seconds=300):
+        self.runner = runner
+        self.backend = backend or InMemoryJobBackend()
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._done = {}
+
+    async def start(self, runner=None):
+        if runner is not None:
+            self.runner = runner
+        if self._tasks:
+            return
+        for job in await self.backend.unfinished():
+            print(f"Resuming generation job {job['id']}")
+            await self._enqueue(job)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _enqueue(self, job):
+        self._done.setdefault(job["id"], asyncio.Event())
+        await self._queue.put(job)
+
+    async def submit(self, educator_id, request):
+        job = new_job(educator_id, request)
+        await self.backend.save(job)
+        await self._enqueue(job)
+        return job
+
+    async def get(self, job_id):
+        return await self.backend.get(job_id)
+
+    async def update(self, job):
+        """Persist changes made to a job outside its run, e.g. an edited paper."""
+        await self._touch(job)
+
+    async def wait(self, job_id, timeout=None):
+        """Wait until the job finishes (or ``timeout`` seconds pass) and return it."""
+        done = self._done.get(job_id)
+        if done is not None:
+            try:
+                await asyncio.wait_for(done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return await self.get(job_id)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "workers": len(self._tasks)}
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+                event = self._done.pop(job["id"], None)
+                if event is not None:
+                    event.set()
+
+    async def _claim(self, job):
+        try:
+            return await self.backend.claim(job["id"], self.owner, self.lease_seconds)
+        except Exception as e:
+            print(f"Could not claim generation job {job['id']}: {e}")
+            return False
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.backend.renew(job_id, self.owner)
+            except Exception as e:
+                print(f"Could not renew generation job {job_id}: {e}")
+
+    async def _run(self, job):
+        if not await self._claim(job):
+            print(f"Generation job {job['id']} is run by another worker")
+            return
+        job["status"] = RUNNING
+        await self._touch(job)
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            await self._execute(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _execute(self, job):
+        async def on_stage(stage):
+            now = time.time()
+            if job["stage"] is not None:
+                job["progress"][job["stage"]].update(status="done", finished_at=now)
+            job["stage"] = stage
+            job["progress"][stage].update(status="running", started_at=now)
+            await self._touch(job)
+
+        try:
+            result = await self.runner(job["request"], on_stage)
+        except Exception as e:
+            traceback.print_exc()
+            job["status"] = FAILED
+            job["error"] = str(e) or e.__class__.__name__
+            if job["stage"] is not None:
+                job["progress"][job["stage"]].update(status="failed", finished_at=time.time())
+        else:
+            if job["stage"] is not None:
+                job["progress"][job["stage"]].update(status="done", finished_at=time.time())
+            job["status"] = SUCCEEDED if result is not None else FAILED
+            job["result"] = result
+            if result is None:
+                job["error"] = "No questions could be generated"
+        await self._touch(job)
+
+    async def _touch(self, job):
+        job["updated_at"] = time.time()
+        try:
+            await self.backend.save(job)
+        except Exception as e:
+            print(f"Could not persist generation job {job['id']}: {e}")
+
+
+def _backend_from_env():
+    if os.getenv("JOB_BACKEND", "memory").lower() == "database":
+        return DatabaseJobBackend()
+    return InMemoryJobBackend()
+
+
+job_manager = JobManager(
+    backend=_backend_from_env(),
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", "300")),
+)
@@ -0,0 +1,191 @@
+import re
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+
+KB_CSV_PATH = "assets/qgenie_kb.csv"
+
+_CHAPTER_PREFIX = re.compile(r'^chapter\s+\d+\s*[-:.]\s*')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_key(value):
+    """Lowercase a class/subject/topic label and collapse its whitespace."""
+    return _WHITESPACE.sub(" ", str(value or "")).strip().lower()
+
+
+def normalize_topic(topic):
+    """Normalize a topic name and drop a leading "Chapter N -" prefix."""
+    return _CHAPTER_PREFIX.sub("", normalize_key(topic))
+
+
+class Chapter(NamedTuple):
+    standard: str
+    subject: str
+    topic: str
+    markdown: str
+
+
+def _extraction_markdown(extraction):
+    if isinstance(extraction, str):
+        return extraction
+    if isinstance(extraction, dict):
+        return str(extraction.get("markdown") or "")
+    return ""
+
+
+def extraction_chapters(rows):
+    """
+    Chapters from (class, subject, topic, extraction) rows, e.g. of uploaded
+    knowledge bases.
+
+    The extraction is expected to hold the chapter markdown, either directly
+    or under a "markdown" key, with the same "# Page Number:" markers as the CSV.
+    """
+    chapters = []
+    for standard, subject, topic, extraction in rows:
+        markdown = _extraction_markdown(extraction)
+        if markdown.strip():
+            chapters.append(Chapter(normalize_key(standard), normalize_key(subject), str(topic).strip(), markdown))
+    return chapters
+
+
+class KnowledgeBaseStore:
+    """
+    Process-wide, read-only view of the knowledge base CSV.
+
+    The CSV is parsed once and indexed by (class, subject, normalized topic) so
+    that chapter markdown can be fetched in O(1) on every paper request.
+    """
+
+    def __init__(self, csv_path=KB_CSV_PATH):
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._chapters = {}
+        self._subjects = {}
+        self._extractions = None
+        self._loaded_at = None
+        self._load_seconds = 0.0
+        # Bumped on every (re)load so derived indexes know when to rebuild
+        self.version = 0
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def load(self, extractions=None):
+        """
+        Parse the CSV and atomically swap in the new index.
+
+        Args:
+            extractions (Callable[[], Iterable[tuple]]): Optional loader of
+                (class, subject, topic, extraction) rows. Their chapters are
+                added for topics the CSV does not cover. It is kept for ``reload``.
+
+        Returns:
+            dict: The store stats after loading.
+        """
+        if extractions is not None:
+            self._extractions = extractions
+        started = time.perf_counter()
+        df = pd.read_csv(self.csv_path).fillna("")
+
+        rows = [
+            Chapter(
+                standard=normalize_key(row[0]),
+                subject=normalize_key(row[1]),
+                topic=str(row[2]).strip(),
+                markdown=str(row[3]),
+            )
+            for row in df.itertuples(index=False)
+        ]
+        if self._extractions is not None:
+            rows.extend(extraction_chapters(self._extractions()))
+
+        chapters = {}
+        subjects = {}
+        for chapter in rows:
+            key = (chapter.standard, chapter.subject, normalize_topic(chapter.topic))
+            if key in chapters:
+                continue
+            chapters[key] = chapter
+            subjects.setdefault(key[:2], {})[key[2]] = chapter
+
+        with self._lock:
+            self._chapters = chapters
+            self._subjects = subjects
+            self._loaded_at = time.time()
+            self._load_seconds = time.perf_counter() - started
+            self.version += 1
+
+        print(f"Knowledge base loaded: {len(chapters)} chapters in {self._load_seconds * 1000:.1f} ms")
+        return self.stats()
+
+    def reload(self, extractions=None):
+        """Re-read the CSV and the extraction rows, e.g. after new chapters were added."""
+        return self.load(extractions)
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def get(self, standard, subject, topic) -> Optional[Chapter]:
+        """Exact lookup of a chapter by class, subject and (normalized) topic."""
+        self._ensure_loaded()
+        return self._chapters.get((normalize_key(standard), normalize_key(subject), normalize_topic(topic)))
+
+    def find(self, standard, subject, topic) -> Optional[Chapter]:
+        """
+        Resolve a requested topic to a chapter.
+
+        Tries the exact normalized key first and falls back to the legacy
+        "requested topic is a substring of the chapter title" match within the
+        same class and subject.
+        """
+        chapter = self.get(standard, subject, topic)
+        if chapter is not None:
+            return chapter
+
+        needle = normalize_key(topic)
+        for candidate in self.subject_chapters(standard, subject).values():
+            if needle in normalize_key(candidate.topic):
+                return candidate
+        return None
+
+    def subject_chapters(self, standard, subject) -> dict:
+        """All chapters of a class/subject keyed by normalized topic."""
+        self._ensure_loaded()
+        return self._subjects.get((normalize_key(standard), normalize_key(subject)), {})
+
+    def subjects(self) -> dict:
+        """Chapters of every class/subject, keyed by (class, subject) and then normalized topic."""
+        self._ensure_loaded()
+        return self._subjects
+
+    def stats(self):
+        chapters = self._chapters
+        markdown_bytes = sum(len(chapter.markdown.encode("utf-8")) for chapter in chapters.values())
+        resident_bytes = sys.getsizeof(chapters) + sum(
+            sys.getsizeof(key) + sum(sys.getsizeof(field) for field in chapter)
+            for key, chapter in chapters.items()
+        )
+        return {
+            "source": self.csv_path,
+            "loaded": self.loaded,
+            "loaded_at": self._loaded_at,
+            "version": self.version,
+            "load_ms": round(self._load_seconds * 1000, 2),
+            "chapters": len(chapters),
+            "subjects": len(self._subjects),
+            "empty_chapters": sum(1 for chapter in chapters.values() if not chapter.markdown.strip()),
+            "markdown_bytes": markdown_bytes,
+            "resident_bytes": resident_bytes,
+        }
+
+
+# Shared instance, loaded on application startup (see main.py)
+knowledge_base = KnowledgeBaseStore()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+from .vertex_client import vertex_governor
+
+
+PRO_MODEL = "gemini-2.5-pro"
+FLASH_MODEL = "gemini-2.5-flash"
+
+# Starting latency estimates until real calls have been observed
+DEFAULT_SECONDS_PER_QUESTION = {
+    PRO_MODEL: 6.0,
+    FLASH_MODEL: 2.0,
+}
+PREFILL_SECONDS_PER_1K_TOKENS = {
+    PRO_MODEL: 0.05,
+    FLASH_MODEL: 0.02,
+}
+
+# Subjective sections worth at least this many marks per question go to pro
+PRO_MIN_MARKS = int(os.getenv("ROUTING_PRO_MIN_MARKS", "5"))
+
+# A model that has been failing is tried first again after this long without failures
+RECOVERY_SECONDS = 60
+
+# Optional latency target per generation call, in seconds (0 = none)
+GENERATION_LATENCY_SLO_SECONDS = float(os.getenv("GENERATION_LATENCY_SLO_SECONDS", "0"))
+
+
+class ModelRouter:
+    """
+    Picks the Gemini model for each generation call.
+
+    Hard questions and high-mark subjective questions go to pro, everything
+    else to flash. A latency SLO moves a section to flash when pro is
+    expected to miss it and flash is not. Models with a high recent failure
+    rate, or whose circuit breaker is open, are moved to the back, and the
+    remaining models are returned as fallbacks in order.
+
+    Latency per question and failure rates are tracked per model as
+    exponentially weighted moving averages of the observed calls.
+    """
+
+    def __init__(self, enabled=True, governor=vertex_governor, alpha=0.2, max_failure_rate=0.5, pro_min_marks=PRO_MIN_MARKS):
+        self.enabled = enabled
+        self.governor = governor
+        self.alpha = alpha
+        self.max_failure_rate = max_failure_rate
+        self.pro_min_marks = pro_min_marks
+        self._lock = threading.Lock()
+        self._models = {
+            model: {"seconds_per_question": seconds, "failure_rate": 0.0, "calls": 0, "failures": 0, "routed": 0, "last_failure": 0.0}
+            for model, seconds in DEFAULT_SECONDS_PER_QUESTION.items()
+        }
+
+    def expected_seconds(self, model, questions, prompt_tokens=0):
+        with self._lock:
+            per_question = self._models[model]["seconds_per_question"]
+        return per_question * max(1, questions) + PREFILL_SECONDS_PER_1K_TOKENS[model] * prompt_tokens / 1000
+
+    def healthy(self, model):
+        with self._lock:
+            stats = self._models[model]
+            failing = stats["failure_rate"] > self.max_failure_rate and time.monotonic() - stats["last_failure"] < RECOVERY_SECONDS
+        return not failing and self.governor.model(model).breaker.state != "open"
+
+    def preferred(self, question_config):
+        difficulty = str(question_config.get('difficulty') or "").lower()
+        question_type = str(question_config.get('type') or "").lower()
+        try:
+            marks = float(question_config.get('marks') or 0)
+        except (TypeError, ValueError):
+            marks = 0
+        if difficulty == "hard" or (question_type == "subjective" and marks >= self.pro_min_marks):
+            return PRO_MODEL
+        return FLASH_MODEL
+
+    def route(self, question_config, prompt_tokens=0, slo_seconds=None):
+        """
+        Args:
+            question_config (dict): The (sub-batch) section to generate.
+            prompt_tokens (int): Estimated prompt size.
+            slo_seconds (float): Latency target for the call, if any.
+
+        Returns:
+            list[str]: Models to try, best first.
+        """
+        if not self.enabled:
+            return [PRO_MODEL]
+
+        try:
+            questions = int(question_config.get('questions') or 1)
+        except (TypeError, ValueError):
+            questions = 1
+
+        primary = self.preferred(question_config)
+        order = [primary, FLASH_MODEL if primary == PRO_MODEL else PRO_MODEL]
+
+        slo_seconds = slo_seconds or GENERATION_LATENCY_SLO_SECONDS
+        if slo_seconds and primary == PRO_MODEL:
+            if self.expected_seconds(PRO_MODEL, questions, prompt_tokens) > slo_seconds >= self.expected_seconds(FLASH_MODEL, questions, prompt_tokens):
+                order.reverse()
+
+        # Stable sort: unhealthy models keep their order but go last
+        order.sort(key=lambda model: not self.healthy(model))
+
+        with self._lock:
+            self._models[order[0]]["routed"] += 1
+        return order
+
+    def record(self, model, questions, seconds, ok, prompt_tokens=0):
+        """Feed back one finished call."""
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                return
+            stats["calls"] += 1
+            stats["failure_rate"] += self.alpha * ((0.0 if ok else 1.0) - stats["failure_rate"])
+            if ok:
+                prefill = PREFILL_SECONDS_PER_1K_TOKENS[model] * prompt_tokens / 1000
+                per_question = max(0.0, seconds - prefill) / max(1, questions)
+                stats["seconds_per_question"] += self.alpha * (per_question - stats["seconds_per_question"])
+            else:
+                stats["failures"] += 1
+                stats["last_failure"] = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items() if key != "last_failure"}
+                for model, stats in self._models.items()
+            }
+
+
+model_router = ModelRouter(enabled=os.getenv("MODEL_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes"))
@@ -3,13 +3,126 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+import copy
+import hashlib
+import os
 import re
 import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
 
 
-def create_question_paper(sections_data, filepath, title, exam_time="3 Hours"):
+_MARKS = re.compile(r'\[Marks (\d+)\]')
+
+# Part of every flowable cache key; bump it whenever the styles or the layout of a question change
+STYLE_VERSION = 1
+
+
+def split_marks(question_text):
+    """The question text without its "[Marks N]" tag, and the tag as displayed ("" if none)."""
+    marks_match = _MARKS.search(question_text)
+    if not marks_match:
+        return question_text, ""
+    return question_text.replace(marks_match.group(0), "").strip(), f"[Marks: {marks_match.group(1)}]"
 
-    # Setup ReportLab styles
+
+def source_text(source):
+    """One line listing the chapters and pages of a question's "source"."""
+    source_str_parts = []
+    for s in source:
+        chapter = s.get("Chapter") or s.get("chapter")
+        page_info = s.get("Page Number") or s.get("page_numbers")
+
+        if chapter and page_info:
+            if isinstance(page_info, list):
+                pages = ", ".join(map(str, page_info))
+                source_str_parts.append(f"Chapter: {chapter}, Page(s): {pages}")
+            else:
+                source_str_parts.append(f"Chapter: {chapter}, Page: {page_info}")
+    return " | ".join(source_str_parts)
+
+
+class CachedParagraph(Paragraph):
+    """
+    Paragraph that remembers its line breaks per width.
+
+    Copies share the memo, so a cached question laid out again in the same
+    frame skips line breaking, which is most of the layout work.
+    """
+
+    # Attributes Paragraph.wrap sets, restored on a memo hit
+    _WRAP_STATE = ("frags", "width", "height", "blPara", "_wrapWidths", "_width_max", "_splitLongWordCount", "_hyphenations")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._breaks = {}
+
+    def wrap(self, availWidth, availHeight):
+        cached = self._breaks.get(availWidth)
+        if cached is None:
+            size = super().wrap(availWidth, availHeight)
+            state = {name: self.__dict__[name] for name in self._WRAP_STATE if name in self.__dict__}
+            self._breaks[availWidth] = (size, state)
+            return size
+        size, state = cached
+        self.__dict__.update(state)
+        return size
+
+
+class FlowableCache:
+    """
+    LRU cache of the flowables of single questions.
+
+    Keyed by document kind, question number, style version and a hash of the
+    question dict, so re-rendering a paper after one question changed only
+    builds and line-breaks that question. Entries are prototypes that are
+    never laid out themselves; every render gets shallow copies, since
+    ReportLab records per-build state on the flowables it places.
+    ``max_entries`` 0 disables the cache: every question is built afresh.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind, number, q_data):
+        content = json.dumps(q_data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{STYLE_VERSION}\0{kind}\0{number}\0{content}".encode("utf-8")).hexdigest()
+
+    def flowables(self, kind, number, q_data, build):
+        """Copies of the cached flowables of a question, built with ``build(number, q_data)`` on a miss."""
+        if self.max_entries <= 0:
+            return build(number, q_data)
+        key = self.key(kind, number, q_data)
+        with self._lock:
+            prototypes = self._entries.get(key)
+            if prototypes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if prototypes is None:
+            prototypes = build(number, q_data)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = prototypes
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return [copy.copy(flowable) for flowable in prototypes]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def question_paper_styles():
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='CenteredHeader', alignment=TA_CENTER, fontSize=16, fontName='Helvetica-Bold'))
     styles.add(ParagraphStyle(name='InfoLine', alignment=TA_CENTER, fontSize=12))
@@ -17,78 +130,10 @@ def create_question_paper(sections_data, filepath, title, exam_time="3 Hours"):
     styles.add(ParagraphStyle(name='QuestionText', fontSize=12, spaceAfter=6, leading=14, leftIndent=18)) # Indent for question text
     styles.add(ParagraphStyle(name='OptionText', fontSize=11, spaceBefore=2, spaceAfter=2, leftIndent=36)) # Further indent for options
     styles.add(ParagraphStyle(name='MarksText', fontSize=10, textColor='#666666', alignment=TA_RIGHT))
+    return styles
 
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
-    story = []
-
-    # Add Header
-    story.append(Paragraph(title, styles['CenteredHeader']))
-    story.append(Spacer(1, 0.1 * inch))
-    story.append(Paragraph(f"Time: {exam_time}", styles['InfoLine']))
-    story.append(Spacer(1, 0.3 * inch))
-
-    question_counter = 1
-    for section_index, section in enumerate(sections_data):
-        for q_data in section:
-            question_text = q_data["question"]
-            options = q_data.get("options")
-
-            # Extract marks from question text if present
-            marks_match = re.search(r'\[Marks (\d+)\]', question_text)
-            marks_str = ""
-            if marks_match:
-                marks_str = f"[Marks: {marks_match.group(1)}]"
-                # Remove marks from the question text for display
-                question_text = question_text.replace(marks_match.group(0), "").strip()
-
-            # Create a list to hold elements for the current question
-            question_elements = []
-
-            # Add question number
-            # # Question Number and Text
-            # story.append(Paragraph(f"{question_counter}. ", styles['QuestionNumber']))
-            
-            # # Question text with potential inline marks removed
-            # question_para = Paragraph(f"{question_text}", styles['QuestionText'])
-            # story.append(question_para)
-
-            story.append(Paragraph(f"{question_counter})  {question_text}", styles['QuestionNumber']))
-            
-            # Add marks on a new line or aligned to the right if possible
-            if marks_str:
-                question_elements.append(Paragraph(marks_str, styles['MarksText']))
-                question_elements.append(Spacer(1, 0.05 * inch)) # Small space after marks
-
-            # Add options if available
-            if options:
-                # Ensure options are sorted (a, b, c, d)
-                sorted_options = sorted(options.items())
-                for key, value in sorted_options:
-                    question_elements.append(Paragraph(f"({key}) {value}", styles['OptionText']))
-                question_elements.append(Spacer(1, 0.2 * inch)) # Space after MCQ options
-            else:
-                # Add more space for subjective questions for students to write
-                question_elements.append(Spacer(1, 0.8 * inch)) # More space for subjective questions
-
-            # Add all elements for the current question to the main story
-            story.extend(question_elements)
-            
-            question_counter += 1
-        
-        # Add a page break after each section for better organization, unless it's the last section
-        # if section_index < len(sections_data) - 1:
-        #      story.append(PageBreak())
-
-    try:
-        doc.build(story)
-        print(f"Question paper '{filepath}' created successfully!")
-    except Exception as e:
-        print(f"Error creating PDF: {e}")
-
-
-def create_answer_sheet(sections_data, filepath, title):
 
-    # Setup ReportLab styles
+def answer_sheet_styles():
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='CenteredTitle', alignment=TA_CENTER, fontSize=16, fontName='Helvetica-Bold'))
     styles.add(ParagraphStyle(name='QuestionNumber', fontSize=12, fontName='Helvetica-Bold', spaceAfter=6, spaceBefore=12))
@@ -100,104 +145,193 @@ def create_answer_sheet(sections_data, filepath, title):
     styles.add(ParagraphStyle(name='ReasonContent', fontSize=11, spaceBefore=2, spaceAfter=6, leftIndent=12))
     styles.add(ParagraphStyle(name='DifficultySource', fontSize=9, textColor='#555555', spaceBefore=4, spaceAfter=2))
     styles.add(ParagraphStyle(name='MarksText', fontSize=10, textColor='#666666', alignment=TA_RIGHT))
+    return styles
+
+
+class PaperRenderer:
+    """
+    Renders question papers and answer sheets.
+
+    The stylesheets are built once and shared by every render (styles are
+    only read while a document is laid out), so a render costs only the
+    flowables and the layout of its own questions. Question flowables come
+    from a ``FlowableCache``, so papers rendered again with few changes
+    reuse the unchanged questions.
+    """
+
+    def __init__(self, cache=None):
+        self.question_styles = question_paper_styles()
+        self.answer_styles = answer_sheet_styles()
+        self.cache = cache if cache is not None else FlowableCache()
+
+    def question_flowables(self, number, q_data):
+        """Flowables of one question on the question paper."""
+        styles = self.question_styles
+        question_text, marks_str = split_marks(q_data["question"])
+        options = q_data.get("options")
+
+        question_elements = [CachedParagraph(f"{number})  {question_text}", styles['QuestionNumber'])]
+
+        # Add marks on a new line or aligned to the right if possible
+        if marks_str:
+            question_elements.append(CachedParagraph(marks_str, styles['MarksText']))
+            question_elements.append(Spacer(1, 0.05 * inch)) # Small space after marks
+
+        # Add options if available
+        if options:
+            # Ensure options are sorted (a, b, c, d)
+            for key, value in sorted(options.items()):
+                question_elements.append(CachedParagraph(f"({key}) {value}", styles['OptionText']))
+            question_elements.append(Spacer(1, 0.2 * inch)) # Space after MCQ options
+        else:
+            # Add more space for subjective questions for students to write
+            question_elements.append(Spacer(1, 0.8 * inch))
+
+        return question_elements
+
+    def answer_flowables(self, number, q_data):
+        """Flowables of one question on the answer sheet."""
+        styles = self.answer_styles
+        question_text, marks_str = split_marks(q_data["question"])
+        options = q_data.get("options")
+        answer = q_data.get("answer")
+        reason = q_data.get("reason")
+        difficulty = q_data.get("difficulty")
+        source = q_data.get("source")
+
+        story = [CachedParagraph(f"{number})  {question_text}", styles['QuestionNumber'])]
+
+        if marks_str:
+            story.append(CachedParagraph(marks_str, styles['MarksText']))
+            story.append(Spacer(1, 0.05 * inch)) # Small space after marks
+
+        # Add MCQ options if available in the question
+        if options:
+            for key, value in sorted(options.items()):
+                story.append(CachedParagraph(f"({key}) {value}", styles['OptionText']))
+            story.append(Spacer(1, 0.1 * inch)) # Small space after MCQ options list
+
+        if options and answer:
+            # For MCQs, show the correct option text
+            story.append(CachedParagraph("<b>Correct Answer:</b>", styles['AnswerLabel']))
+            story.append(CachedParagraph(f"({answer}) {options.get(answer)}", styles['AnswerContent']))
+
+        # Add Reason/Solution
+        if reason:
+            story.append(CachedParagraph("<b>Reason:</b>", styles['ReasonLabel']))
+            story.append(CachedParagraph(reason.replace("\\n", "<br/>"), styles['ReasonContent']))
+        elif not options and answer: # If it's a subjective question and 'answer' is the full solution
+            story.append(CachedParagraph("<b>Solution:</b>", styles['ReasonLabel']))
+            story.append(CachedParagraph(answer.replace("\\n", "<br/>"), styles['ReasonContent']))
+
+        if difficulty:
+            story.append(CachedParagraph(f"<b>Difficulty:</b> {difficulty}", styles['DifficultySource']))
+
+        if source:
+            sources = source_text(source)
+            if sources:
+                story.append(CachedParagraph(f"<b>Source:</b> {sources}", styles['DifficultySource']))
+
+        story.append(Spacer(1, 0.3 * inch)) # Space after each question's answer/reason
+        return story
+
+    def _build(self, filepath, story):
+        try:
+            SimpleDocTemplate(filepath, pagesize=letter).build(story)
+            return True
+        except Exception as e:
+            print(f"Error creating PDF: {e}")
+            return False
+
+    def question_paper(self, sections_data, filepath, title, exam_time="3 Hours"):
+        """
+        Args:
+            filepath: Path or writable binary file object (e.g. ``BytesIO``) the PDF is written to.
+
+        Returns:
+            bool: True if the PDF was built.
+        """
+        styles = self.question_styles
+        story = [
+            Paragraph(title, styles['CenteredHeader']),
+            Spacer(1, 0.1 * inch),
+            Paragraph(f"Time: {exam_time}", styles['InfoLine']),
+            Spacer(1, 0.3 * inch),
+        ]
+        questions = (q_data for section in sections_data for q_data in section)
+        for number, q_data in enumerate(questions, start=1):
+            story.extend(self.cache.flowables("question", number, q_data, self.question_flowables))
+        return self._build(filepath, story)
+
+    def answer_sheet(self, sections_data, filepath, title):
+        """
+        Args:
+            filepath: Path or writable binary file object (e.g. ``BytesIO``) the PDF is written to.
+
+        Returns:
+            bool: True if the PDF was built.
+        """
+        story = [
+            Paragraph(title, self.answer_styles['CenteredTitle']),
+            Spacer(1, 0.3 * inch),
+        ]
+        questions = (q_data for section in sections_data for q_data in section)
+        for number, q_data in enumerate(questions, start=1):
+            story.extend(self.cache.flowables("answer", number, q_data, self.answer_flowables))
+        return self._build(filepath, story)
+
+    def render_question_paper(self, sections_data, title, exam_time="3 Hours"):
+        """The question paper PDF as bytes, rendered in memory, or None on error."""
+        buffer = BytesIO()
+        if not self.question_paper(sections_data, buffer, title, exam_time):
+            return None
+        return buffer.getvalue()
+
+    def render_answer_sheet(self, sections_data, title):
+        """The answer sheet PDF as bytes, rendered in memory, or None on error."""
+        buffer = BytesIO()
+        if not self.answer_sheet(sections_data, buffer, title):
+            return None
+        return buffer.getvalue()
+
+    def render(self, sections_data, title, exam_time="3 Hours"):
+        """
+        Render a paper in memory.
+
+        Returns:
+            tuple[bytes, bytes]: The question paper and answer sheet PDFs (None for one that failed).
+        """
+        return (
+            self.render_question_paper(sections_data, title, exam_time),
+            self.render_answer_sheet(sections_data, f"{title} - Answer Key"),
+        )
+
+    def render_batch(self, papers):
+        """
+        Render many papers in one call.
+
+        Args:
+            papers (list[tuple]): ``(sections_data, title)`` or ``(sections_data, title, exam_time)`` per paper.
+
+        Returns:
+            list[tuple[bytes, bytes]]: The PDFs of each paper, in order.
+        """
+        return [self.render(*paper) for paper in papers]
+
+
+renderer = PaperRenderer(cache=FlowableCache(max_entries=int(os.getenv("RENDER_CACHE_ENTRIES", "5000"))))
+# For papers rendered once, so that only edited papers fill the cache above
+uncached_renderer = PaperRenderer(cache=FlowableCache(max_entries=0))
+
 
+def create_question_paper(sections_data, filepath, title, exam_time="3 Hours"):
+    """See ``PaperRenderer.question_paper``."""
+    return renderer.question_paper(sections_data, filepath, title, exam_time)
 
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
-    story = []
-
-    # Add Title
-    story.append(Paragraph(title, styles['CenteredTitle']))
-    story.append(Spacer(1, 0.3 * inch))
-
-    question_counter = 1
-    for section_index, section in enumerate(sections_data):
-        for q_data in section:
-            question_text = q_data["question"]
-            options = q_data.get("options")
-            answer = q_data.get("answer")
-            reason = q_data.get("reason")
-            difficulty = q_data.get("difficulty")
-            source = q_data.get("source")
-
-            # Extract marks from question text if present (and clean for display)
-            marks_match = re.search(r'\[Marks (\d+)\]', question_text)
-            marks_str = ""
-            if marks_match:
-                marks_str = f"[Marks: {marks_match.group(1)}]"
-                question_text = question_text.replace(marks_match.group(0), "").strip() # Remove marks from question
-
-            # # Question Number and Text
-            # story.append(Paragraph(f"{question_counter}. ", styles['QuestionNumber']))
-            
-            # # Question text with potential inline marks removed
-            # question_para = Paragraph(f"{question_text}", styles['QuestionText'])
-            # story.append(question_para)
-
-            story.append(Paragraph(f"{question_counter})  {question_text}", styles['QuestionNumber']))
-            
-            # Add marks on a new line or aligned to the right if possible
-            if marks_str:
-                story.append(Paragraph(marks_str, styles['MarksText']))
-                story.append(Spacer(1, 0.05 * inch)) # Small space after marks
-
-            # Add MCQ options if available in the question
-            if options:
-                sorted_options = sorted(options.items())
-                for key, value in sorted_options:
-                    story.append(Paragraph(f"({key}) {value}", styles['OptionText']))
-                story.append(Spacer(1, 0.1 * inch)) # Small space after MCQ options list
-
-            if options and answer:
-                # For MCQs, show the correct option text
-                story.append(Paragraph("<b>Correct Answer:</b>", styles['AnswerLabel']))
-                correct_option_text = options.get(answer)
-                story.append(Paragraph(f"({answer}) {correct_option_text}", styles['AnswerContent']))
-            # elif answer:
-            #     # For subjective questions, the 'answer' field is the solution
-            #     story.append(Paragraph(answer.replace("\\n", "<br/>"), styles['AnswerContent'])) # Replace \n with <br/> for ReportLab
-
-            # Add Reason/Solution
-            if reason:
-                story.append(Paragraph("<b>Reason:</b>", styles['ReasonLabel']))
-                story.append(Paragraph(reason.replace("\\n", "<br/>"), styles['ReasonContent']))
-            elif not options and answer: # If it's a subjective question and 'answer' is the full solution
-                story.append(Paragraph("<b>Solution:</b>", styles['ReasonLabel']))
-                story.append(Paragraph(answer.replace("\\n", "<br/>"), styles['ReasonContent']))
-
-            # Add Difficulty
-            if difficulty:
-                story.append(Paragraph(f"<b>Difficulty:</b> {difficulty}", styles['DifficultySource']))
-
-            # Add Source
-            if source:
-                source_str_parts = []
-                for s in source:
-                    chapter = s.get("Chapter") or s.get("chapter")
-                    page_info = s.get("Page Number") or s.get("page_numbers")
-                    
-                    if chapter and page_info:
-                        if isinstance(page_info, list):
-                            pages = ", ".join(map(str, page_info))
-                            source_str_parts.append(f"Chapter: {chapter}, Page(s): {pages}")
-                        else:
-                            source_str_parts.append(f"Chapter: {chapter}, Page: {page_info}")
-                if source_str_parts:
-                    story.append(Paragraph(f"<b>Source:</b> {' | '.join(source_str_parts)}", styles['DifficultySource']))
-            
-            story.append(Spacer(1, 0.3 * inch)) # Space after each question's answer/reason
-
-            question_counter += 1
-        
-        # Add a page break after each section for better organization, unless it's the last section
-        # if section_index < len(sections_data) - 1:
-        #      story.append(PageBreak())
-
-    try:
-        doc.build(story)
-        print(f"Answer sheet '{filepath}' created successfully!")
-    except Exception as e:
-        print(f"Error creating PDF: {e}")
 
+def create_answer_sheet(sections_data, filepath, title):
+    """See ``PaperRenderer.answer_sheet``."""
+    return renderer.answer_sheet(sections_data, filepath, title)
 
 
 if __name__ == "__main__":
@@ -216,4 +350,4 @@ if __name__ == "__main__":
     create_answer_sheet(sections_data, OUTPUT_FILENAME_ANSWER, ANSWER_KEY_TITLE)
 
     # Generate the PDF
-    create_question_paper(sections_data, OUTPUT_FILENAME, EXAM_NAME)
\ No newline at end of file
+    create_question_paper(sections_data, OUTPUT_FILENAME, EXAM_NAME)
@@ -1,11 +1,30 @@
 from google import genai
+from google.genai import types
 from google.oauth2 import service_account
 
+import asyncio
 import os
 import json
-import pandas as pd
-
-from .paper_generation import create_question_paper, create_answer_sheet
+import time
+from typing import NamedTuple
+
+from .context_cache import CONTEXT_CACHE_ENABLED, VertexContextCacheBackend, context_cache
+from .dedupe import LSHIndex, dedupe_paper, dedupe_questions
+from .intent_parser import parse_class_subject, parse_exam_specifications
+from .model_router import model_router
+from .query_cache import cached_query, class_subject_cache, exam_specifications_cache
+from .question_bank import question_bank
+from .retrieval import retriever, section_query
+from .schemas import (
+    ClassSubject, ExamSpecification, parse_class_subject_output,
+    parse_exam_specifications_output, question_schema, validate_question, validate_questions,
+)
+from .stream_parser import IncrementalArrayParser, parse_question_list
+from .token_budget import estimate_tokens, fit_markdown, reference_budget, retrieval_budget
+from .topic_matcher import topic_matcher
+from .vertex_client import CircuitOpenError, GovernedClient, vertex_governor
+from .worker_pool import worker_pool
+from .render_service import render_service
 
 
 # Set the path to your service account key file
@@ -20,7 +39,33 @@ SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
 credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
 
 # Initialize the GenAI client with the loaded credentials
-client = genai.Client(vertexai=True, project="versatile-blend-466717-r7", location="us-central1", credentials=credentials)
+# Every call goes through the shared rate governor (quota buckets, retries, circuit breaker)
+client = GovernedClient(
+    genai.Client(vertexai=True, project="versatile-blend-466717-r7", location="us-central1", credentials=credentials),
+    vertex_governor,
+)
+
+# Large retrieved references are sent once per model as Vertex cached content (opt-in)
+if CONTEXT_CACHE_ENABLED:
+    context_cache.backend = VertexContextCacheBackend(client)
+
+# Default generation model; model_router picks the model per call
+GENERATION_MODEL = "gemini-2.5-pro"
+
+# Stands in for the references when they are supplied as cached content
+CACHED_REFERENCES = "The chapter content provided in the cached context."
+
+# Maximum number of Gemini generation calls in flight for one paper
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+
+# Sections asking for more questions are split into parallel sub-batches of this size
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "5"))
+
+# Extra calls allowed per section to make up for dropped or missing questions
+MAX_TOP_UP_ROUNDS = 2
+
+# Paper-level passes over sections still short once everything else is done (0 disables)
+MAX_REPAIR_PASSES = int(os.getenv("MAX_REPAIR_PASSES", "1"))
 
 
 def hello_world_prompt():
@@ -38,98 +83,29 @@ def hello_world_prompt():
         return None
     
 
+@cached_query(class_subject_cache)
 def class_subject_prompt(user_query):
 
-    PROMPT1 = """ Your task is to extract "standard" and "subject" information from the user's query and format it as a JSON object.
+    # Plain "class 10 maths" style queries are resolved locally without a model call
+    parsed = parse_class_subject(user_query)
+    if parsed is not None:
+        return parsed
+
+    PROMPT1 = """ Your task is to extract the "standard" and "subject" of a question paper from the user's query.
 
     Here are the only supported combinations:
     - **CLASS 10 - MATHS**
     - **CLASS 12 - PHYSICS**
 
-    If the user query contains information matching one of these supported combinations, populate the JSON object.
-    If any one key is missing, then keep it empty string. If both are not present, return None
-
-    Don't use ``` at the start & end of the json
-
-    **JSON Format:**
-
-    {
-        "standard": {
-            "id": "Standard Name",
-            "name": "Standard Name"
-        },
-        "subject": {
-            "id": "Subject Name",
-            "name": "Subject Name"
-        }
-    }
-
-    Example 1: 
-
-    User Query - Create a paper for Class 10
-
-    Output - 
-
-    {
-        "standard": {
-            "id": "CLASS 10",
-            "name": "CLASS 10"
-        },
-        "subject": {
-            "id": "",
-            "name": ""
-        }
-    }
-
-    Example 2: 
-
-    User Query - I need a question paper for class 12 & maths
-
-    Output - 
-
-    {
-        "standard": {
-            "id": "CLASS 12",
-            "name": "CLASS 12"
-        },
-        "subject": {
-            "id": "",
-            "name": ""
-        }
-    }
-
-    Example 3: 
-
-    User Query - I'm interested in Class 9 chemistry paper
-
-    Output - 
-
-    {
-        "standard": {
-            "id": "",
-            "name": ""
-        },
-        "subject": {
-            "id": "",
-            "name": ""
-        }
-    }
-
-    Example 3: 
-
-    User Query - Not a relevant query
-
-    Output - 
-
-    None
-
-    #####################
+    Fill in a value only if it is mentioned and belongs to a supported combination; otherwise keep it empty.
 
+    Examples:
+    - "Create a paper for Class 10": standard CLASS 10, subject empty
+    - "I need a question paper for class 12 & maths": standard CLASS 12, subject empty
+    - "I'm interested in Class 9 chemistry paper": both empty
+    - "Not a relevant query": not relevant
 
     Actual User Query: """ + user_query + """
-
-    Output - 
-
     """
 
     try:
@@ -137,137 +113,36 @@ def class_subject_prompt(user_query):
         response = client.models.generate_content(
             model="gemini-2.5-flash",
             contents=PROMPT1,
+            config=structured_config(ClassSubject),
         )
 
-        json_response = json.loads(response.text)
-
-        return json_response
+        return parse_class_subject_output(response.text)
     except Exception as e:
         print(e)
         return None
     
+@cached_query(exam_specifications_cache)
 def extract_exam_specifications_prompt(user_query):
+    parsed = parse_exam_specifications(user_query)
+    if parsed is not None:
+        return parsed
+
     PROMPT2 = """Your task is to extract exam paper specifications from the user's query.
     Specifically, you need to identify the 'difficulty', 'type' of questions, 'number of questions', and 'marks per question'.
 
-    The output should be a JSON list of dictionaries. Each dictionary in the list represents a set of specifications.
-    If multiple sets of specifications are mentioned (e.g., "3 easy MCQs for 1 mark each and 2 hard Subjective questions for 5 marks each"), extract all of them as separate dictionaries in the list.
-
-    If a specific piece of information (difficulty, type, questions, marks) is not explicitly mentioned for a given specification set, keep its value as null.
-    If the user query is not relevant to exam paper specifications at all, return None.
-
-    Don't use ``` at the start & end of the json.
-
-    **JSON Format:**
-
-    [
-        {
-            "difficulty": "difficulty_level",
-            "type": "question_type",
-            "questions": number_of_questions,
-            "marks": marks_per_question
-        },
-        // ... more dictionaries if multiple specifications are found
-    ]
-
-    **Supported Values for 'difficulty':**
-    - 'easy'
-    - 'medium'
-    - 'hard'
-
-    **Supported Values for 'type':**
-    - 'MCQ' (Multiple Choice Questions)
-    - 'Subjective' (Subjective Questions)
-
-    **Example 1:**
-
-    User Query: I need 5 easy mcqs, 1 mark each.
-
-    Output:
-
-    [
-        {
-            "difficulty": "easy",
-            "type": "MCQ",
-            "questions": 5,
-            "marks": 1
-        }
-    ]
-
-    **Example 2:**
-
-    User Query: Create a paper with 3 medium Subjective questions, 10 marks each. Also, add 2 easy MCQs.
-
-    Output:
-
-    [
-        {
-            "difficulty": "medium",
-            "type": "Subjective",
-            "questions": 3,
-            "marks": 10
-        },
-        {
-            "difficulty": "easy",
-            "type": "MCQ",
-            "questions": 2,
-            "marks": 0
-        }
-    ]
-
-    **Example 3:**
-
-    User Query: I want 7 hard questions.
-
-    Output:
-
-    [
-        {
-            "difficulty": "hard",
-            "type": "",
-            "questions": 7,
-            "marks": 0
-        }
-    ]
-
-    **Example 4:**
-
-    User Query: Give me some general knowledge facts.
-
-    Output:
-
-    None
-
-    **Example 5:**
-
-    User Query: generate 3 medium mcq with 1 mark each.
-
-    Output:
-
-    [
-        {
-            "difficulty": "medium",
-            "type": "MCQ",
-            "questions": 3,
-            "marks": 1
-        }
-    ]
-
-    **Example 6:**
-
-    User Query: not relevant query 
+    If multiple sets of specifications are mentioned (e.g., "3 easy MCQs for 1 mark each and 2 hard Subjective questions for 5 marks each"), extract each set separately.
+    If the user query is not relevant to exam paper specifications at all, return an empty list.
 
-    Output:
-
-    None
-
-    #####################
+    **Supported Values for 'difficulty':** easy, medium, hard
+    **Supported Values for 'type':** MCQ (Multiple Choice Questions), Subjective (Subjective Questions)
 
+    Examples:
+    - "I need 5 easy mcqs, 1 mark each": easy, MCQ, 5 questions, 1 mark
+    - "Create a paper with 3 medium Subjective questions, 10 marks each. Also, add 2 easy MCQs": medium, Subjective, 3 questions, 10 marks; easy, MCQ, 2 questions, marks not mentioned
+    - "I want 7 hard questions": hard, type not mentioned, 7 questions, marks not mentioned
+    - "Give me some general knowledge facts": not relevant
 
     Actual User Query: """ + user_query + """
-
-    Output -
-
     """
 
     try:
@@ -275,25 +150,58 @@ def extract_exam_specifications_prompt(user_query):
         response = client.models.generate_content(
             model="gemini-2.5-flash",
             contents=PROMPT2,
+            config=structured_config(list[ExamSpecification]),
         )
 
-        json_response = json.loads(response.text)
-
-        return json_response
+        return parse_exam_specifications_output(response.text)
     except Exception as e:
         print(e)
         return None
     
 
-def generate_mcq_answer_dict(curriculum, standard, subject, markdown, question_config):
+def structured_config(schema, cached_content=None):
+    """
+    Generation config making the model answer with JSON matching ``schema``.
+
+    Lists must be builtin generics (``list[Model]``): google-genai turns
+    ``typing.List[Model]`` into an empty schema that Vertex rejects.
+    """
+    return types.GenerateContentConfig(
+        cached_content=cached_content,
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+
+
+def questions_from_response(text, schema):
+    """
+    Questions of a generation response matching ``schema``, or None if there are none.
+
+    Structured output normally validates in one pass. A response cut off at
+    the token limit, or otherwise off-schema, keeps every complete question
+    that validates; the section top-up then asks only for the ones that were lost.
+    """
+    questions = validate_questions(text or "", schema)
+    if questions is not None:
+        return questions or None
+
+    parsed = parse_question_list(text)
+    questions = [question for question in (validate_question(item, schema) for item in parsed.questions) if question is not None]
+    invalid = len(parsed.questions) - len(questions)
+    print(f"Recovered {len(questions)} questions from malformed output "
+          f"({parsed.repaired} repaired, {parsed.dropped + invalid} dropped, truncated: {parsed.truncated})")
+    return questions or None
+
+
+def mcq_prompt(curriculum, standard, subject, markdown, question_config, model=GENERATION_MODEL):
 
     MCQ_PROMPT = """ System Prompt:
         You are a Question Paper Generator tasked with creating high-quality multiple-choice questions (MCQs) from the provided chapter content. You will be given:
 
         1. A JSON object specifying the exact number of questions to generate for each difficulty level ("Easy", "Medium", "Hard") Note that generate questions for only given difficulty.
-        2. Don't add ``` characters at the start and the end of your response.
-        3. Chapter content as a markdown with chapter names & page numbers for references
-        4. Never reference something without context. Never mention this table or that reference without providing that context in the answer.
+        2. Chapter content as a markdown with chapter names & page numbers for references
+        3. Never reference something without context. Never mention this table or that reference without providing that context in the answer.
+        4. The JSON may have an "avoid" list of questions already in the paper. Do not repeat them or ask the same thing in other words.
 
         You must strictly adhere to the specified number of MCQs per difficulty level. Generate only as many questions as requested—no more, no fewer.
 
@@ -308,24 +216,6 @@ def generate_mcq_answer_dict(curriculum, standard, subject, markdown, question_c
         3. Hard:
         - Require synthesis, critical thinking, or decision-making in unfamiliar contexts.
 
-        Output Format:
-        Return a list of JSON objects, each structured as follows:
-        [
-            {
-                "question": "<Your MCQ question text (mention the marks count at the end of the question in square brackets like e.g [Marks 5])>",
-                "options": {
-                    "a": "<Option A>",
-                    "b": "<Option B>",
-                    "c": "<Option C>",
-                    "d": "<Option D>"
-                },
-                "answer": "<Correct option key>",
-                "reason": "<Explain why the chosen option is correct and why the other options are incorrect, if relevant.>",
-                "difficulty": "Easy" | "Medium" | "Hard",
-                "source": [<dict of chapter name & page numbers used to generate this question>]
-            },
-        ]
-
     """
 
     user_prompt = f""" # User prompt:
@@ -336,38 +226,27 @@ def generate_mcq_answer_dict(curriculum, standard, subject, markdown, question_c
 
         References: 
 
-        {markdown}
+        {{markdown}}
     """
 
-    prompt = MCQ_PROMPT + user_prompt 
-
-    # print(prompt)
-
-    try:
-
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=prompt,
-        )
+    if markdown is None:
+        return MCQ_PROMPT + user_prompt.replace("{markdown}", CACHED_REFERENCES)
 
-        # print(response.text)
+    # Keep the prompt within the model's budget, leaving room for the answer
+    budget = reference_budget(model, question_config, MCQ_PROMPT + user_prompt)
+    markdown = fit_markdown(markdown, budget, query=question_config, label=model)
 
-        json_response = json.loads(response.text)
-
-        return json_response
-    except Exception as e:
-        print(e)
-        return None
+    return MCQ_PROMPT + user_prompt.replace("{markdown}", markdown)
     
-def generate_subjective_answer_dict(curriculum, standard, subject, markdown, question_config):
+def subjective_prompt(curriculum, standard, subject, markdown, question_config, model=GENERATION_MODEL):
 
     MCQ_PROMPT = """ System Prompt:
         You are a Question Paper Generator tasked with creating high-quality subjective questions from the provided chapter content. You will be given:
 
         1. A JSON object specifying the exact number of questions to generate for each difficulty level ("Easy", "Medium", "Hard") Note that generate questions for only given difficulty.
-        2. Don't add ``` characters at the start and the end of your response.
-        3. Chapter content as a markdown with chapter names & page numbers for references
-        4. Never reference something without context. Never mention this table or that reference without providing that context in the answer.
+        2. Chapter content as a markdown with chapter names & page numbers for references
+        3. Never reference something without context. Never mention this table or that reference without providing that context in the answer.
+        4. The JSON may have an "avoid" list of questions already in the paper. Do not repeat them or ask the same thing in other words.
 
         You must **strictly follow the provided question counts per difficulty level**—no more, no less.
 
@@ -391,17 +270,6 @@ def generate_subjective_answer_dict(curriculum, standard, subject, markdown, que
                 - Encourage higher-order thinking like evaluation and hypothesis testing.
 
 
-        Output Format:
-        Return a list of JSON objects, each structured as follows:
-        [
-            {
-                "question": "<Your question text (mention the marks count at the end of the question in square brackets like e.g [Marks 5])>",
-                "difficulty": "Easy" | "Medium" | "Hard",
-                "answer": "<Key points/ideas for a full mark answer>",
-                "difficulty": "Easy" | "Medium" | "Hard",
-                "source": [<dict of chapter name & page numbers used to generate this question>]
-            },
-        ]
     """
 
     user_prompt = f""" # User prompt:
@@ -412,116 +280,804 @@ def generate_subjective_answer_dict(curriculum, standard, subject, markdown, que
 
         References: 
 
-        {markdown}
+        {{markdown}}
     """
 
-    prompt = MCQ_PROMPT + user_prompt 
+    if markdown is None:
+        return MCQ_PROMPT + user_prompt.replace("{markdown}", CACHED_REFERENCES)
+
+    # Keep the prompt within the model's budget, leaving room for the answer
+    budget = reference_budget(model, question_config, MCQ_PROMPT + user_prompt)
+    markdown = fit_markdown(markdown, budget, query=question_config, label=model)
+
+    return MCQ_PROMPT + user_prompt.replace("{markdown}", markdown)
+    
+
+def section_prompt(curriculum, standard, subject, markdown, question_config: dict, model=GENERATION_MODEL):
+    """The MCQ or subjective generation prompt for one question_config."""
 
-    # print(prompt)
+    if question_config['type'].lower() == "mcq":
+        return mcq_prompt(curriculum, standard, subject, markdown, json.dumps(question_config), model)
+
+    return subjective_prompt(curriculum, standard, subject, markdown, json.dumps(question_config), model)
+
+
+def generation_config(question_config: dict, cached_content=None):
+    return structured_config(list[question_schema(question_config)], cached_content)
+
+
+async def agenerate_answer_dict(curriculum, standard, subject, markdown, question_config: dict, cached_content=None, model=GENERATION_MODEL):
+    """
+    Generate one question_config section through the async Gemini client.
+
+    With ``cached_content`` the references come from that cache and
+    ``markdown`` is None.
+    """
+
+    prompt = section_prompt(curriculum, standard, subject, markdown, question_config, model)
 
     try:
 
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
+        response = await client.aio.models.generate_content(
+            model=model,
             contents=prompt,
+            config=generation_config(question_config, cached_content),
         )
 
-        # print(response.text)
+        return questions_from_response(response.text, question_schema(question_config))
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        print(e)
+        # Rejected cached content has probably expired on the server
+        if cached_content is not None and getattr(e, "code", None) in (400, 403, 404):
+            await context_cache.invalidate(cached_content)
+        return None
+
 
-        json_response = json.loads(response.text)
+async def astream_answer_dict(curriculum, standard, subject, markdown, question_config: dict, cached_content=None, model=GENERATION_MODEL):
+    """Stream one question_config section, yielding each question as soon as the model completes it."""
 
-        return json_response
+    prompt = section_prompt(curriculum, standard, subject, markdown, question_config, model)
+    schema = question_schema(question_config)
+    parser = IncrementalArrayParser()
+
+    try:
+
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            contents=prompt,
+            config=generation_config(question_config, cached_content),
+        )
+
+        async for chunk in stream:
+            for item in parser.feed(chunk.text or ""):
+                question = validate_question(item, schema)
+                if question is None:
+                    parser.errors.append(f"off-schema: {str(item)[:80]}")
+                    continue
+                yield question
+
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(e)
-        return None
-    
+        # Rejected cached content has probably expired on the server
+        if cached_content is not None and getattr(e, "code", None) in (400, 403, 404):
+            await context_cache.invalidate(cached_content)
 
-def generate_question_paper(user_input: dict):
+    for error in parser.errors:
+        print(f"Skipped malformed streamed question: {error}")
+
+
+async def areferences(model, markdown):
+    """
+    Inline markdown and cached content name for one call on ``model``.
+
+    The retrieved references of a sub-batch are served from a context cache
+    (each model needs its own) when caching is enabled and they are large
+    enough; otherwise they are sent inline.
+    """
+    cached_content = await context_cache.get(model, markdown)
+    if cached_content is None:
+        return markdown, None
+    return None, cached_content
+
+
+async def agenerate_routed(curriculum, standard, subject, markdown, question_config: dict, slo_seconds=None):
+    """
+    Generate one call on the model chosen by ``model_router``, falling back
+    to the next model if it fails. Latency and outcome are fed back to the router.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of every model refused the call.
+    """
+    prompt_tokens = estimate_tokens(markdown or "")
+    questions = requested_questions(question_config)
+    refused, attempted = None, False
+
+    for model in model_router.route(question_config, prompt_tokens, slo_seconds):
+        call_markdown, cached_content = await areferences(model, markdown)
+        started = time.perf_counter()
+        try:
+            result = await agenerate_answer_dict(curriculum, standard, subject, call_markdown, question_config, cached_content, model)
+        except CircuitOpenError as e:
+            print(e)
+            refused = e
+            continue
+        attempted = True
+        model_router.record(model, questions, time.perf_counter() - started, result is not None, prompt_tokens)
+        if result is not None:
+            return result
+        print(f"Generation on {model} failed, trying the next model")
+
+    if refused is not None and not attempted:
+        raise refused
+    return None
+
+
+async def astream_routed(curriculum, standard, subject, markdown, question_config: dict, slo_seconds=None):
+    """Streaming counterpart of ``agenerate_routed``; falls back only if a model produced nothing."""
+    prompt_tokens = estimate_tokens(markdown or "")
+    questions = requested_questions(question_config)
+    refused, attempted = None, False
+
+    for model in model_router.route(question_config, prompt_tokens, slo_seconds):
+        call_markdown, cached_content = await areferences(model, markdown)
+        started = time.perf_counter()
+        produced = 0
+        try:
+            async for question in astream_answer_dict(curriculum, standard, subject, call_markdown, question_config, cached_content, model):
+                produced += 1
+                yield question
+        except CircuitOpenError as e:
+            print(e)
+            refused = e
+            continue
+        attempted = True
+        model_router.record(model, questions, time.perf_counter() - started, produced > 0, prompt_tokens)
+        if produced:
+            return
+        print(f"Streaming generation on {model} failed, trying the next model")
+
+    if refused is not None and not attempted:
+        raise refused
+
+
+def requested_questions(question_config):
+    try:
+        return max(0, int(question_config.get('questions') or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def shard_count(question_config, batch_size=GENERATION_BATCH_SIZE):
+    """Number of parallel sub-batches a section is split into."""
+    return max(1, -(-requested_questions(question_config) // max(1, batch_size)))
+
+
+def shard_config(question_config, shards):
+    """Split a section's question count as evenly as possible across ``shards`` sub-batches."""
+    requested = requested_questions(question_config)
+    if shards <= 1 or requested == 0:
+        return [question_config]
+    base, extra = divmod(requested, shards)
+    return [
+        {**question_config, 'questions': base + (1 if shard < extra else 0)}
+        for shard in range(shards)
+    ]
+
+
+async def agenerate_section(call, question_config, slices, existing=()):
+    """
+    Generate one section as parallel sub-batches and merge them.
+
+    Each sub-batch gets its own retrieved-context slice. Near-duplicates are
+    dropped while merging, then short sections are topped up with follow-up
+    calls that list the questions already generated, and trimmed to the
+    exact requested count.
+
+    Args:
+        call: Coroutine function ``call(question_config, markdown)`` returning a list of questions or None.
+        question_config (dict): The section as requested.
+        slices (list[str]): Reference markdown per sub-batch.
+        existing (list[dict]): Questions the section already has (e.g. from
+            the question bank); the model is asked to avoid them and
+            near-duplicates of them are dropped.
+
+    Returns:
+        list[dict] | None: The newly generated questions, or None if nothing was generated.
+    """
+    existing = list(existing)
+    requested = requested_questions(question_config)
+    if existing:
+        question_config = {**question_config, 'avoid': [question['question'] for question in existing]}
+    shards = shard_config(question_config, len(slices))
+
+    results = await asyncio.gather(*[call(shard, markdown) for shard, markdown in zip(shards, slices)])
+
+    index = LSHIndex()
+    for question in existing:
+        index.insert(question)
+
+    questions = []
+    for result in results:
+        if isinstance(result, list):
+            questions.extend(dedupe_questions(result, index=index))
+
+    for round_index in range(MAX_TOP_UP_ROUNDS):
+        shortfall = requested - len(questions)
+        if shortfall <= 0:
+            break
+        print(f"Section short by {shortfall} question(s), topping up")
+        top_up = {
+            **question_config,
+            'questions': shortfall,
+            'avoid': [question['question'] for question in existing + questions],
+        }
+        result = await call(top_up, slices[round_index % len(slices)])
+        if isinstance(result, list):
+            questions.extend(dedupe_questions(result, index=index))
+
+    if requested:
+        questions = questions[:requested]
+
+    return questions or None
+
+
+async def agenerate_sections(curriculum, standard, subject, question_configs, section_slices, concurrency=GENERATION_CONCURRENCY, section_existing=None, slo_seconds=None, errors=None):
+    """
+    Generate all sections of a paper concurrently.
+
+    At most ``concurrency`` Gemini calls are in flight at once, across all
+    sections and their sub-batches. The results are returned in the order of
+    ``question_configs``, with None for sections that failed.
+    ``section_existing`` optionally gives per section the questions it
+    already has (see ``agenerate_section``). Each call runs on the model
+    ``model_router`` picks for it. Calls refused by open circuit breakers
+    are recorded in ``errors``, if given, by position in ``question_configs``.
+    """
+    if section_existing is None:
+        section_existing = [[] for _ in question_configs]
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    def caller(position):
+        async def call(question_config, markdown):
+            async with semaphore:
+                try:
+                    return await agenerate_routed(curriculum, standard, subject, markdown, question_config, slo_seconds)
+                except CircuitOpenError as e:
+                    if errors is not None:
+                        errors[position] = str(e)
+                    return None
+        return call
+
+    async def run(position, question_config, slices, existing):
+        print(curriculum, standard, subject)
+        print(json.dumps(question_config, indent=4))
+        print()
+
+        section_json = await agenerate_section(caller(position), question_config, slices, existing)
+
+        print(json.dumps(section_json, indent=4, ensure_ascii=True))
+        return section_json
+
+    return await asyncio.gather(*[
+        run(position, question_config, slices, existing)
+        for position, (question_config, slices, existing) in enumerate(zip(question_configs, section_slices, section_existing))
+    ])
 
-    df = pd.read_csv("assets/qgenie_kb.csv")
+
+async def astream_question_paper(user_input: dict, concurrency=GENERATION_CONCURRENCY):
+    """
+    Streaming variant of the generation stage.
+
+    Sections and their sub-batches are streamed concurrently and events are
+    yielded as they happen:
+
+    - ``{"event": "section", "section": i, "config": {...}}`` when a section starts
+    - ``{"event": "question", "section": i, "number": n, "question": {...}}`` per question
+    - ``{"event": "section_done", "section": i, "count": n}`` when a section is complete,
+      with an "error" if it is short because Vertex refused its calls
+    - ``{"event": "generated", "sections": master_json}`` once, at the end
+
+    Raises ``CircuitOpenError`` at the end if nothing could be generated
+    because the circuit breakers refused every call.
+
+    Every question is checked against one near-duplicate index of the whole
+    paper before it is sent, so the streamed questions are exactly the
+    questions of the final paper. Sections still short after their top-ups
+    get the repair pass of ``arepair_sections`` before they are done.
+    """
 
     curriculum = user_input['curriculum']['name']
+    standard = user_input['standard']['name']
+    subject = user_input['subject']['name']
+    question_configs = user_input['question_config']
+
+    plan = await aplan_sections(user_input)
+    pending = dict(zip(plan.pending, zip(plan.configs, plan.slices)))
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    events = asyncio.Queue()
+    paper_index = LSHIndex()
+    sections = [
+        dedupe_questions([question for _, question in section], index=paper_index)
+        for section in plan.drawn
+    ]
+
+    errors = {}
+
+    async def stream_call(index, requested, question_config, markdown):
+        async with semaphore:
+            try:
+                async for question in astream_routed(curriculum, standard, subject, markdown, question_config, user_input.get('latency_slo_seconds')):
+                    if requested and len(sections[index]) >= requested:
+                        continue
+                    if not dedupe_questions([question], index=paper_index):
+                        continue
+                    await accept(index, question)
+            except CircuitOpenError as e:
+                errors[index] = str(e)
+
+    async def accept(index, question):
+        sections[index].append(question)
+        await events.put({"event": "question", "section": index, "number": len(sections[index]), "question": question})
+
+    async def repair(index, question_config):
+        section_errors = {}
+        for _ in range(MAX_REPAIR_PASSES):
+            shortfall = requested_questions(question_config) - len(sections[index])
+            if shortfall <= 0:
+                return
+            repaired = await arepair_sections(
+                {**user_input, 'question_config': [question_config]},
+                plan.chapters,
+                [list(sections[index])],
+                semaphore,
+                section_errors,
+            )
+            if 0 in section_errors:
+                errors[index] = section_errors[0]
+            # Other sections kept streaming meanwhile; check against the whole paper
+            new = repaired[0][len(sections[index]):]
+            for question in dedupe_questions(new, index=paper_index)[:shortfall]:
+                await accept(index, question)
+
+    async def generate_section(index, question_config):
+        config, slices = pending[index]
+        if sections[index]:
+            config = {**config, 'avoid': [question['question'] for question in sections[index]]}
+
+        requested = requested_questions(question_config)
+        shards = shard_config(config, len(slices))
+        await asyncio.gather(*[stream_call(index, requested, shard, markdown) for shard, markdown in zip(shards, slices)])
+
+        for round_index in range(MAX_TOP_UP_ROUNDS):
+            shortfall = requested - len(sections[index])
+            if shortfall <= 0:
+                break
+            top_up = {
+                **question_config,
+                'questions': shortfall,
+                'avoid': [question['question'] for question in sections[index]],
+            }
+            await stream_call(index, requested, top_up, slices[round_index % len(slices)])
+
+    async def run_section(index, question_config):
+        await events.put({"event": "section", "section": index, "config": question_config})
+
+        # Questions served from the question bank go out first
+        for number, question in enumerate(sections[index], start=1):
+            await events.put({"event": "question", "section": index, "number": number, "question": question})
+
+        if index in pending:
+            await generate_section(index, question_config)
+
+        # Also covers bank questions dropped as repeats of another section's
+        await repair(index, question_config)
+        done = {"event": "section_done", "section": index, "count": len(sections[index])}
+        error = section_report(question_config, sections[index], errors.get(index)).get("error")
+        if error:
+            done["error"] = error
+        await events.put(done)
+
+    async def run_all():
+        try:
+            await asyncio.gather(*[
+                run_section(index, question_config)
+                for index, question_config in enumerate(question_configs)
+            ])
+        finally:
+            await events.put(None)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+        await runner
+    finally:
+        # The client went away: stop generating
+        runner.cancel()
+
+    await worker_pool.run(save_to_bank, user_input, plan, sections)
+
+    if errors and not any(sections):
+        raise CircuitOpenError(next(iter(errors.values())))
+
+    yield {"event": "generated", "sections": [section for section in sections if section]}
+
+
+def generate_question_paper(user_input: dict):
+    """Synchronous entry point, e.g. for scripts. See ``agenerate_question_paper``."""
+    return asyncio.run(agenerate_question_paper(user_input))
+
+
+def resolve_chapters(user_input: dict):
+    """Knowledge base chapter titles for the requested topics, in request order."""
+
     standard = user_input['standard']['name']
     subject = user_input['subject']['name']
     topics = [topic['name'] for topic in user_input['topics']]
 
 
-    markdown = ""
+    resolution = topic_matcher.resolve(standard, subject, topics)
+
+    if resolution.missing:
+        print(f"Topics not found in knowledge base: {resolution.missing}")
+
+    for topic, candidates in resolution.ambiguous.items():
+        print(f"Topic '{topic}' matches several chapters, using '{candidates[0].topic}'")
+
+    chapters = []
 
     for topic in topics:
 
-        df_filter = df.apply(lambda x: topic.lower() in x['topic'].lower(), axis=1)
+        chapter = resolution.matches.get(topic)
 
-        if df_filter.sum().item() == 0:
+        if chapter is None or not chapter.markdown:
             continue;
-        
-        markdown += "Chapter : " + topic + " \n \n "
-        markdown += df[df_filter]['markdown'].iloc[0]
 
-    master_json = []
+        if chapter.topic not in chapters:
+            chapters.append(chapter.topic)
 
-    for question_config in user_input['question_config']:
+    return chapters
 
-        print(curriculum, standard, subject, topics)
-        print(json.dumps(question_config, indent=4))
 
-        print()
+def prepare_sections(user_input: dict, chapters=None):
+    """
+    Resolve the requested topics and retrieve the reference slices of every
+    section. CPU-bound, so the async pipeline runs it on the worker pool.
 
-        if question_config['type'].lower() == "mcq":
-            mcq_json = generate_mcq_answer_dict(
-                curriculum,
-                standard,
-                subject,
-                markdown,
-                json.dumps(question_config),
-            )
+    Returns:
+        list[list[str]]: Per question_config, one reference markdown per sub-batch.
+    """
 
-            if mcq_json != None:
-                master_json.append(mcq_json)
-
-            print(json.dumps(mcq_json, indent=4, ensure_ascii=True))
-            
-        else:
-            subjective_json = generate_subjective_answer_dict(
-                curriculum,
-                standard,
-                subject,
-                markdown,
-                json.dumps(question_config),
-            )
+    standard = user_input['standard']['name']
+    subject = user_input['subject']['name']
 
-            if subjective_json != None:
-                master_json.append(subjective_json)
+    if chapters is None:
+        chapters = resolve_chapters(user_input)
+
+    # Only the most relevant pages of the selected chapters go into each prompt,
+    # about a page per question; large sections get one disjoint slice per sub-batch
+    return retriever.retrieve_slices(
+        standard,
+        subject,
+        chapters,
+        [
+            section_query(chapters, question_config, user_input.get('query', ''))
+            for question_config in user_input['question_config']
+        ],
+        [shard_count(question_config) for question_config in user_input['question_config']],
+        token_budget=[
+            retrieval_budget(GENERATION_MODEL, shard_config(question_config, shard_count(question_config))[0])
+            for question_config in user_input['question_config']
+        ],
+    )
+
+
+async def aprepare_references(user_input: dict, chapters=None):
+    """
+    References for every section of the paper: the retrieved slice of each
+    sub-batch, within the prompt budget. Which of them are served from
+    context caches is decided per call (see ``areferences``).
+
+    Returns:
+        list[list[str]]: Per question_config, one markdown per sub-batch.
+    """
+
+    if chapters is None:
+        chapters = await worker_pool.run(resolve_chapters, user_input)
+
+    return await worker_pool.run(prepare_sections, user_input, chapters)
+
+
+class SectionPlan(NamedTuple):
+    chapters: list
+    drawn: list  # per section, (bank id, question) pairs from the question bank
+    pending: list  # indices of the sections that still need generated questions
+    configs: list  # the shortfall question_config of each pending section
+    slices: list  # references per pending section and sub-batch
+
+
+def shortfall_config(question_config, drawn):
+    """
+    What is left of a section after ``drawn`` bank questions, or None if
+    nothing is. A section asking for no questions never needs any.
+    """
+    requested = requested_questions(question_config)
+    if requested <= len(drawn):
+        return None
+    if not drawn:
+        return question_config
+    return {**question_config, 'questions': requested - len(drawn)}
+
+
+async def aplan_sections(user_input: dict):
+    """
+    Serve what the question bank already has for each section, then
+    retrieve references for the shortfall only.
+
+    Questions salvaged from an earlier attempt at the same paper
+    (``user_input['salvaged']``, one list per section) are kept and count
+    towards their sections first.
+    """
+
+    question_configs = user_input['question_config']
+    salvaged = user_input.get('salvaged') or [[] for _ in question_configs]
+
+    chapters = await worker_pool.run(resolve_chapters, user_input)
+    draw_configs = [
+        shortfall_config(question_config, section) or {**question_config, 'questions': 0}
+        for question_config, section in zip(question_configs, salvaged)
+    ]
+    bank_drawn = await worker_pool.run(question_bank.draw, user_input.get('educator_id'), user_input, chapters, draw_configs)
+    drawn = [
+        [(None, question) for question in section] + from_bank
+        for section, from_bank in zip(salvaged, bank_drawn)
+    ]
+
+    pending, configs = [], []
+    for index, (question_config, section) in enumerate(zip(question_configs, drawn)):
+        config = shortfall_config(question_config, [question for _, question in section])
+        if config is not None:
+            pending.append(index)
+            configs.append(config)
+
+    if sum(len(section) for section in bank_drawn):
+        print(f"Question bank served {sum(len(section) for section in bank_drawn)} question(s), {len(pending)} section(s) still to generate")
+
+    slices = []
+    if configs:
+        slices = await aprepare_references({**user_input, 'question_config': configs}, chapters)
+
+    return SectionPlan(chapters, drawn, pending, configs, slices)
+
+
+def save_to_bank(user_input: dict, plan: SectionPlan, sections):
+    """Store the paper's new questions in the question bank. Blocking; run it on the worker pool."""
+
+    # Questions dropped as duplicates after drawing are neither stored nor marked as used;
+    # salvaged questions (no bank id) were handled by the earlier attempt
+    kept = {id(question) for section in sections for question in section}
+    drawn = {id(question): question_id for section in plan.drawn for question_id, question in section}
+
+    question_bank.save_paper(
+        user_input.get('educator_id'),
+        user_input,
+        plan.chapters,
+        user_input['question_config'],
+        [question_id for key, question_id in drawn.items() if key in kept and question_id is not None],
+        [[question for question in section if id(question) not in drawn] for section in sections],
+    )
+
+
+def section_report(question_config, questions, error=None):
+    """
+    How far a section got: requested vs delivered count and a status, plus
+    ``error`` (why its calls were refused) if it is short.
+    """
+    requested = requested_questions(question_config)
+    delivered = len(questions)
+    if delivered >= requested:
+        status = "complete"
+    elif delivered == 0:
+        status = "failed"
+    else:
+        status = "partial"
+    report = {"requested": requested, "delivered": delivered, "status": status}
+    if error and status != "complete":
+        report["error"] = error
+    return report
+
+
+async def arepair_sections(user_input: dict, chapters, sections, semaphore=None, errors=None):
+    """
+    One targeted pass over the sections that are still short, asking only
+    for their missing questions (e.g. after a failed call, malformed output
+    or cross-section de-duplication), instead of rerunning the paper.
+
+    Its Gemini calls count against ``semaphore`` (the paper's generation
+    concurrency, see ``agenerate_sections``), or a new one of the same size.
+    Calls refused by open circuit breakers are recorded in ``errors``, if
+    given, by section index.
+
+    Returns:
+        list[list[dict]]: ``sections`` with the repaired ones extended.
+    """
+
+    curriculum = user_input['curriculum']['name']
+    standard = user_input['standard']['name']
+    subject = user_input['subject']['name']
+    question_configs = user_input['question_config']
+
+    short, configs = [], []
+    for index, (question_config, section) in enumerate(zip(question_configs, sections)):
+        config = shortfall_config(question_config, section)
+        if config is not None:
+            short.append(index)
+            configs.append({**config, 'avoid': [question['question'] for question in section]} if section else config)
+
+    if not short:
+        return sections
+
+    print(f"Repairing {len(short)} short section(s): {[section_report(question_configs[index], sections[index]) for index in short]}")
+
+    slices = await aprepare_references({**user_input, 'question_config': configs}, chapters)
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, GENERATION_CONCURRENCY))
+
+    async def call(index, question_config, markdown):
+        async with semaphore:
+            try:
+                return await agenerate_routed(curriculum, standard, subject, markdown, question_config, user_input.get('latency_slo_seconds'))
+            except CircuitOpenError as e:
+                if errors is not None:
+                    errors[index] = str(e)
+                return None
+
+    async def repair(index, config, section_slices):
+        shards = shard_config(config, len(section_slices))
+        results = await asyncio.gather(*[call(index, shard, markdown) for shard, markdown in zip(shards, section_slices)])
+        return [question for result in results if isinstance(result, list) for question in result]
+
+    results = await asyncio.gather(*[
+        repair(index, config, section_slices)
+        for index, config, section_slices in zip(short, configs, slices)
+    ])
+
+    # New questions must not repeat anything already in the paper
+    index = LSHIndex()
+    for section in sections:
+        for question in section:
+            index.insert(question)
+
+    sections = list(sections)
+    for position, config, result in zip(short, configs, results):
+        accepted = dedupe_questions(result, index=index)
+        missing = requested_questions(config)
+        sections[position] = sections[position] + (accepted[:missing] if missing else accepted)
+    return sections
 
-            print(json.dumps(subjective_json, indent=4, ensure_ascii=True))
 
-    OUTPUT_FILENAME_QUESTION = os.path.join(os.getcwd(), "question_paper.pdf")
-    OUTPUT_FILENAME_ANSWER = os.path.join(os.getcwd(), "answer_sheet.pdf")
+def paper_title(subject):
+    return subject.title() + " Sample Paper"
+
+
+async def arender_paper(master_json, subject, edit=False):
+    """
+    Render the question paper and answer sheet PDFs in memory, in parallel on
+    the render processes, or with ``edit`` in the edit process to reuse the
+    flowables of the unchanged questions.
+
+    Returns:
+        tuple[bytes, bytes]: The two PDFs, or Nones for an empty paper.
+    """
 
     if len(master_json) == 0:
+        return None, None
+
+    title = paper_title(subject)
+    if edit:
+        return await render_service.render_edit(master_json, title)
+    return await render_service.render(master_json, title)
+
+
+async def arender_variants(variants, subject):
+    """
+    PDFs of every ``(label, sections)`` variant of a paper, rendered in one
+    batch spread over the render processes.
 
-        if os.path.exists(OUTPUT_FILENAME_QUESTION):
-            os.remove(OUTPUT_FILENAME_QUESTION)
+    Returns:
+        list[tuple[bytes, bytes]]: Question paper and answer sheet per variant, in order.
+    """
+    title = paper_title(subject)
+    return await render_service.render_batch([
+        ([section for section in sections if section], f"{title} - Set {label}")
+        for label, sections in variants
+    ])
 
-        if os.path.exists(OUTPUT_FILENAME_ANSWER):
-            os.remove(OUTPUT_FILENAME_ANSWER)
 
-        return None, None, None, None;
+async def agenerate_question_paper(user_input: dict, on_stage=None):
+    """
+    Generate the paper and render its PDFs.
 
-    with open("test_json.json", 'w') as file:
-        json.dump(master_json, file)
+    ``on_stage``, if given, is awaited with "retrieve", "generate" and
+    "render" as each stage starts, for job progress reporting.
 
-    exam_title = subject.title() + " Sample Paper"
-    answer_title = f"{exam_title} - Answer Key"
+    Returns:
+        tuple: ``(master_json, question_pdf, answer_pdf, subject, sections)``
+        where ``sections`` reports per question_config what was requested
+        and delivered (with the questions, so a later attempt can salvage
+        them), or five Nones if nothing could be generated.
+    """
 
-    # Generate the PDF
-    create_question_paper(master_json, OUTPUT_FILENAME_QUESTION, exam_title)
+    async def report(stage):
+        if on_stage is not None:
+            await on_stage(stage)
 
-    # Generate the Answer Sheet PDF
-    create_answer_sheet(master_json, OUTPUT_FILENAME_ANSWER, answer_title)
+    curriculum = user_input['curriculum']['name']
+    standard = user_input['standard']['name']
+    subject = user_input['subject']['name']
+
+    await report("retrieve")
+    plan = await aplan_sections(user_input)
+    sections = [[question for _, question in section] for section in plan.drawn]
+
+    await report("generate")
+
+    # All sections are generated concurrently; the wall-clock cost is roughly the slowest one
+    refused = {}
+    section_results = await agenerate_sections(
+        curriculum,
+        standard,
+        subject,
+        plan.configs,
+        plan.slices,
+        section_existing=[sections[index] for index in plan.pending],
+        slo_seconds=user_input.get('latency_slo_seconds'),
+        errors=refused,
+    )
+    errors = {plan.pending[position]: error for position, error in refused.items()}
+
+    for index, section_json in zip(plan.pending, section_results):
+        sections[index] = sections[index] + (section_json or [])
+
+    # Sections are generated independently, so repeats across them are only caught here
+    sections = dedupe_paper(sections)
+
+    for _ in range(MAX_REPAIR_PASSES):
+        if all(shortfall_config(question_config, section) is None for question_config, section in zip(user_input['question_config'], sections)):
+            break
+        sections = await arepair_sections(user_input, plan.chapters, sections, errors=errors)
+
+    master_json = [section_json for section_json in sections if section_json]
+
+    if master_json:
+        await report("render")
+    (question_pdf, answer_pdf), _ = await asyncio.gather(
+        arender_paper(master_json, subject),
+        worker_pool.run(save_to_bank, user_input, plan, sections),
+    )
 
-    return master_json, OUTPUT_FILENAME_QUESTION, OUTPUT_FILENAME_ANSWER, subject
+    if len(master_json) == 0:
+        # Vertex refused the calls: fail with the reason instead of an empty paper
+        if errors:
+            raise CircuitOpenError(next(iter(errors.values())))
+        return None, None, None, None, None;
+
+    report_sections = [
+        {**section_report(question_config, section, errors.get(index)), "questions": section}
+        for index, (question_config, section) in enumerate(zip(user_input['question_config'], sections))
+    ]
 
+    return master_json, question_pdf, answer_pdf, subject, report_sections
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+import copy
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+}
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+_WORD = re.compile(r'[a-z]+|\d+(?:\.\d+)?')
+
+
+def _canonical_number(value):
+    number = float(value)
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def normalize_query(text):
+    """
+    Cache key for a chat query: lowercase words and numbers only, single
+    spaces, number words and zero-padded or "1.0"-style numbers canonicalized.
+    """
+    tokens = []
+    for token in _WORD.findall(str(text or "").lower()):
+        if token in _NUMBER_WORDS:
+            token = str(_NUMBER_WORDS[token])
+        elif _NUMBER.fullmatch(token):
+            token = _canonical_number(token)
+        tokens.append(token)
+    return " ".join(tokens)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """
+    Shared cache for multi-worker deployments.
+
+    Wraps any client with redis-py's ``get`` / ``setex`` interface; values
+    are stored as JSON under ``prefix``.
+    """
+
+    def __init__(self, client, prefix="qgenie:query:", ttl_seconds=3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl_seconds, json.dumps(value))
+
+
+class QueryCache:
+    """
+    Normalized-query cache in front of an LLM extraction prompt.
+
+    Lookups go to the local LRU first, then to the optional shared backend
+    (whose hits are copied into the LRU). Only non-None results are stored,
+    since None also stands for a failed model call.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl_seconds=3600, shared=None):
+        self.name = name
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _key(self, query):
+        return f"{self.name}:{normalize_query(query)}"
+
+    def get(self, query):
+        key = self._key(query)
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                print(f"Shared query cache unavailable: {e}")
+                value = None
+            if value is not None:
+                self.local.set(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, query, value):
+        if value is None:
+            return
+        key = self._key(query)
+        self.local.set(key, copy.deepcopy(value))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                print(f"Shared query cache unavailable: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.local),
+                "max_entries": self.local.max_entries,
+                "ttl_seconds": self.local.ttl_seconds,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def cached_query(cache):
+    """Decorator caching ``fn(user_query)`` in ``cache`` by normalized query."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(user_query):
+            value = cache.get(user_query)
+            if value is not None:
+                return value
+            value = fn(user_query)
+            cache.set(user_query, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def shared_backend_from_env():
+    """Redis backend when QUERY_CACHE_REDIS_URL is set and the redis package is installed."""
+    url = os.getenv("QUERY_CACHE_REDIS_URL")
+    if not url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        print("QUERY_CACHE_REDIS_URL is set but the redis package is not installed; using the local cache only")
+        return None
+    return RedisCacheBackend(redis.Redis.from_url(url), ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "86400"))
+
+_shared_backend = shared_backend_from_env()
+
+class_subject_cache = QueryCache("class_subject", QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS, _shared_backend)
+exam_specifications_cache = QueryCache("exam_specifications", QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS, _shared_backend)
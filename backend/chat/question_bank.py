@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from db.database import get_db
+from db.models import BankQuestion, BankQuestionUse
+
+from .dedupe import LSHIndex, question_text
+from .knowledge_base import normalize_key, normalize_topic
+from .text_processing import tokenize
+
+
+def content_hash(question):
+    """Hash of the question's words, so reworded whitespace or marks tags do not create new entries."""
+    return hashlib.sha256(" ".join(tokenize(question_text(question))).encode("utf-8")).hexdigest()
+
+
+def question_topic(question, chapters):
+    """
+    The chapter a generated question belongs to, from the chapter names in
+    its "source". Questions from a single-chapter paper belong to that chapter.
+    Returns None when it cannot be told.
+    """
+    source = json.dumps(question.get("source") or "", ensure_ascii=False).lower()
+    for chapter in chapters:
+        if normalize_topic(chapter) in source:
+            return chapter
+    if len(chapters) == 1:
+        return chapters[0]
+    return None
+
+
+def bank_key(user_input, question_config):
+    """Indexed columns shared by a paper's section and the bank entries it draws."""
+    return {
+        "curriculum": normalize_key(user_input['curriculum']['name']),
+        "standard": normalize_key(user_input['standard']['name']),
+        "subject": normalize_key(user_input['subject']['name']),
+        "type": normalize_key(question_config.get('type')),
+        "difficulty": normalize_key(question_config.get('difficulty')),
+        "marks": int(question_config.get('marks') or 0),
+    }
+
+
+def _uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+class QuestionBank:
+    """
+    Stores every generated question and serves them to later papers.
+
+    Entries are indexed by (curriculum, standard, subject, topic, type,
+    difficulty, marks). ``draw`` hands out stored questions matching a
+    section that the educator has not been given before; only the shortfall
+    is then generated, and ``save_paper`` adds the new questions and records
+    everything the educator received.
+
+    New questions that near-duplicate a stored one (per subject, checked
+    with an in-memory LSH index built from the table on first use) are not
+    stored again; the educator is recorded as having used the stored one.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._indexes = {}
+        self.drawn = 0
+        self.requested = 0
+        self.stored = 0
+        self.near_duplicates = 0
+
+    def draw(self, educator_id, user_input, chapters, question_configs):
+        """
+        Args:
+            educator_id (str): Questions already used by this educator are skipped.
+            user_input (dict): The paper request.
+            chapters (list[str]): Knowledge base chapter titles of the paper.
+            question_configs (list[dict]): The sections to draw for.
+
+        Returns:
+            list[list[tuple[uuid.UUID, dict]]]: Per section, up to its
+            requested count of (bank id, question).
+        """
+        requested = [max(0, int(question_config.get('questions') or 0)) for question_config in question_configs]
+        with self._lock:
+            self.requested += sum(requested)
+
+        if not self.enabled or not chapters or not educator_id:
+            return [[] for _ in question_configs]
+
+        topics = [normalize_topic(chapter) for chapter in chapters]
+        drawn = []
+        taken = set()
+        try:
+            with get_db() as db:
+                used = db.query(BankQuestionUse.question_id)\
+                    .filter(BankQuestionUse.educator_id == _uuid(educator_id))
+                for question_config, count in zip(question_configs, requested):
+                    rows = []
+                    if count:
+                        query = db.query(BankQuestion)\
+                            .filter_by(**bank_key(user_input, question_config))\
+                            .filter(BankQuestion.topic.in_(topics))\
+                            .filter(~BankQuestion.id.in_(used))
+                        # Sections with the same key must not share questions
+                        if taken:
+                            query = query.filter(~BankQuestion.id.in_(taken))
+                        rows = query.order_by(func.random()).limit(count).all()
+                    taken.update(row.id for row in rows)
+                    drawn.append([(row.id, row.question) for row in rows])
+        except Exception as e:
+            print(f"Question bank unavailable: {e}")
+            return [[] for _ in question_configs]
+
+        with self._lock:
+            self.drawn += sum(len(section) for section in drawn)
+        return drawn
+
+    def _subject_index(self, db, key):
+        """LSH index of the stored questions of one (curriculum, standard, subject), keyed by bank id."""
+        index = self._indexes.get(key)
+        if index is None:
+            index = LSHIndex()
+            curriculum, standard, subject = key
+            rows = db.query(BankQuestion.id, BankQuestion.question)\
+                .filter_by(curriculum=curriculum, standard=standard, subject=subject)\
+                .all()
+            for question_id, question in rows:
+                index.insert(question, key=question_id)
+            self._indexes[key] = index
+        return index
+
+    def save_paper(self, educator_id, user_input, chapters, question_configs, drawn_ids, generated):
+        """
+        Add the newly generated questions to the bank and mark all of the
+        paper's questions as used by the educator.
+
+        Args:
+            question_configs (list[dict]): The sections of the paper.
+            drawn_ids (list[uuid.UUID]): Bank ids of the drawn questions.
+            generated (list[list[dict]]): Newly generated questions per section.
+        """
+        if not self.enabled or not educator_id:
+            return
+
+        subject_key = tuple(bank_key(user_input, {})[column] for column in ("curriculum", "standard", "subject"))
+        near_duplicates = 0
+        try:
+            with self._index_lock, get_db() as db:
+                index = self._subject_index(db, subject_key)
+                question_ids = list(drawn_ids)
+                new_rows = {}
+                for question_config, questions in zip(question_configs, generated):
+                    key = bank_key(user_input, question_config)
+                    for question in questions or []:
+                        topic = question_topic(question, chapters)
+                        if topic is None:
+                            continue
+                        duplicate_of = index.find(question)
+                        if duplicate_of is not None:
+                            question_ids.append(duplicate_of)
+                            near_duplicates += 1
+                            continue
+                        digest = content_hash(question)
+                        new_rows.setdefault(digest, {
+                            **key,
+                            "id": uuid.uuid4(),
+                            "topic": normalize_topic(topic),
+                            "question": question,
+                            "source": question.get("source"),
+                            "content_hash": digest,
+                        })
+
+                # Other workers may store the same question concurrently: the
+                # no-op update makes RETURNING give the id of whichever row won
+                inserted = []
+                if new_rows:
+                    statement = insert(BankQuestion).values(list(new_rows.values()))
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[BankQuestion.content_hash],
+                        set_={"content_hash": statement.excluded.content_hash},
+                    ).returning(BankQuestion.id, BankQuestion.content_hash)
+                    for question_id, digest in db.execute(statement):
+                        question_ids.append(question_id)
+                        row = new_rows[digest]
+                        if row["id"] == question_id:
+                            inserted.append((question_id, row["question"]))
+
+                if question_ids:
+                    educator = _uuid(educator_id)
+                    db.execute(
+                        insert(BankQuestionUse)
+                        .values([
+                            {"id": uuid.uuid4(), "question_id": question_id, "educator_id": educator}
+                            for question_id in dict.fromkeys(question_ids)
+                        ])
+                        .on_conflict_do_nothing(constraint="unique_question_educator")
+                    )
+
+                # Only index rows once they are committed
+                db.commit()
+                for question_id, question in inserted:
+                    index.insert(question, key=question_id)
+        except Exception as e:
+            print(f"Could not save questions to the bank: {e}")
+            return
+
+        with self._lock:
+            self.stored += len(inserted)
+            self.near_duplicates += near_duplicates
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requested": self.requested,
+                "drawn": self.drawn,
+                "stored": self.stored,
+                "near_duplicates": self.near_duplicates,
+                "draw_rate": round(self.drawn / self.requested, 4) if self.requested else 0.0,
+            }
+
+
+question_bank = QuestionBank(enabled=os.getenv("QUESTION_BANK_ENABLED", "true").lower() in ("1", "true", "yes"))
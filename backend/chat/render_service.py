@@ -0,0 +1,238 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .paper_generation import renderer, uncached_renderer
+from .worker_pool import WorkerPoolSaturated, worker_pool
+
+
+def _render_document(kind, payload):
+    """
+    Child process entry point: one PDF from a JSON payload.
+
+    The renderer and its stylesheets are inherited from the parent at fork
+    time, so children do no setup of their own. Children never see a paper
+    twice, so they render without the flowable cache.
+    """
+    sections_data, title, exam_time = json.loads(payload)
+    if kind == "question":
+        return uncached_renderer.render_question_paper(sections_data, title, exam_time)
+    return uncached_renderer.render_answer_sheet(sections_data, f"{title} - Answer Key")
+
+
+def _render_edit(payload):
+    """
+    Edit process entry point: both PDFs of an edited paper from a JSON
+    payload, with the flowable cache this process keeps for edits, plus
+    the stats of that cache.
+    """
+    sections_data, title, exam_time = json.loads(payload)
+    question_pdf, answer_pdf = renderer.render(sections_data, title, exam_time)
+    return question_pdf, answer_pdf, renderer.cache.stats()
+
+
+def _ready():
+    return os.getpid()
+
+
+class RenderService:
+    """
+    Renders paper PDFs in a pool of worker processes.
+
+    ReportLab layout is pure Python and holds the GIL, so rendering on
+    threads stalls the API worker. Here the question paper and the answer
+    sheet of a paper are laid out in parallel in separate processes, and
+    concurrent papers spread over all of them. Papers go to the children
+    as one compact JSON string and come back as PDF bytes.
+
+    Edited papers go to one more, pinned process that keeps the flowable
+    cache, so every edit of every paper finds the questions it laid out
+    before. The render pool does not cache (a paper reaches it only once),
+    so the first edit of a paper still builds every question.
+
+    Workers are forked once, by ``start``, which the app calls on startup
+    before any other threads exist: forking later, from a process running
+    the thread pool and the event loop, can leave a child holding a lock
+    no thread will release. So if the processes were never started, are
+    disabled (``max_workers`` 0) or break, papers (and edits) are rendered
+    on the thread pool instead for the rest of the process's life.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._edit_executor = None
+        self._edit_cache = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rendered = 0
+        self._failed = 0
+        self._fallbacks = 0
+        self._edits = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+
+    def start(self):
+        """Fork the worker processes; only before any other threads exist."""
+        with self._lock:
+            if self._started or self.max_workers <= 0:
+                return
+            self._started = True
+            context = multiprocessing.get_context("fork")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            self._edit_executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
+            executors = [self._executor, self._edit_executor]
+        # The first submit forks every worker at once
+        for executor in executors:
+            executor.submit(_ready).result()
+
+    async def _render_in_pool(self, payload):
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(
+            loop.run_in_executor(self._executor, _render_document, "question", payload),
+            loop.run_in_executor(self._executor, _render_document, "answer", payload),
+        )
+
+    async def render(self, sections_data, title, exam_time="3 Hours"):
+        """
+        Args:
+            sections_data (list[list[dict]]): Questions per section.
+            title (str): Title of the question paper; the answer sheet adds " - Answer Key".
+
+        Returns:
+            tuple[bytes, bytes]: The question paper and answer sheet PDFs (None for one that failed).
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise WorkerPoolSaturated(f"{self._pending} papers already waiting to be rendered")
+            self._pending += 1
+
+        started = time.perf_counter()
+        try:
+            if self._executor is None:
+                return await self._render_on_threads(sections_data, title, exam_time)
+            payload = json.dumps([sections_data, title, exam_time], separators=(",", ":"), ensure_ascii=False)
+            try:
+                question_pdf, answer_pdf = await self._render_in_pool(payload)
+            except BrokenProcessPool as e:
+                print(f"Render pool broken, rendering on threads: {e}")
+                self._restart()
+                return await self._render_on_threads(sections_data, title, exam_time)
+            with self._lock:
+                self._rendered += 1
+                if question_pdf is None or answer_pdf is None:
+                    self._failed += 1
+            return question_pdf, answer_pdf
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._busy_seconds += time.perf_counter() - started
+
+    async def render_edit(self, sections_data, title, exam_time="3 Hours"):
+        """
+        Render an edited paper in the edit process, which keeps the flowable
+        cache: from the second edit of a paper on, only the changed
+        questions are built and line-broken again.
+
+        Returns:
+            tuple[bytes, bytes]: The question paper and answer sheet PDFs.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise WorkerPoolSaturated(f"{self._pending} papers already waiting to be rendered")
+            self._pending += 1
+            self._edits += 1
+            executor = self._edit_executor
+
+        started = time.perf_counter()
+        try:
+            if executor is None:
+                return await worker_pool.run(renderer.render, sections_data, title, exam_time)
+            payload = json.dumps([sections_data, title, exam_time], separators=(",", ":"), ensure_ascii=False)
+            try:
+                question_pdf, answer_pdf, cache_stats = await asyncio.get_running_loop().run_in_executor(executor, _render_edit, payload)
+            except BrokenProcessPool as e:
+                print(f"Edit render process broken, rendering edits on threads: {e}")
+                self._stop_edits()
+                return await worker_pool.run(renderer.render, sections_data, title, exam_time)
+            with self._lock:
+                self._edit_cache = cache_stats
+            return question_pdf, answer_pdf
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._busy_seconds += time.perf_counter() - started
+
+    async def render_batch(self, papers):
+        """
+        Render many papers concurrently across the pool.
+
+        Args:
+            papers (list[tuple]): ``(sections_data, title)`` or ``(sections_data, title, exam_time)`` per paper.
+
+        Returns:
+            list[tuple[bytes, bytes]]: The PDFs of each paper, in order.
+        """
+        return await asyncio.gather(*(self.render(*paper) for paper in papers))
+
+    async def _render_on_threads(self, sections_data, title, exam_time):
+        with self._lock:
+            self._fallbacks += 1
+        return await worker_pool.run(uncached_renderer.render, sections_data, title, exam_time)
+
+    def _restart(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _stop_edits(self):
+        with self._lock:
+            executor, self._edit_executor = self._edit_executor, None
+            self._edit_cache = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.max_workers if self._executor is not None else 0,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "rendered": self._rendered,
+                "failed": self._failed,
+                "thread_fallbacks": self._fallbacks,
+                "edits": self._edits,
+                "edit_process": self._edit_executor is not None,
+                "edit_cache": self._edit_cache if self._edit_executor is not None else renderer.cache.stats(),
+                "rejected": self._rejected,
+                "busy_seconds": round(self._busy_seconds, 3),
+            }
+
+    def shutdown(self):
+        self._restart()
+        self._stop_edits()
+
+
+def default_render_processes():
+    """
+    Two per API worker process (one paper's two PDFs at once), fewer when
+    the uvicorn workers (WEB_CONCURRENCY) would otherwise outnumber the cores.
+    """
+    api_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, min(2, (os.cpu_count() or 1) // api_workers))
+
+
+render_service = RenderService(
+    max_workers=int(os.getenv("RENDER_PROCESSES", str(default_render_processes()))),
+    max_queue=int(os.getenv("RENDER_QUEUE_LIMIT", "32")),
+)
@@ -0,0 +1,324 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+from .knowledge_base import knowledge_base, normalize_key, normalize_topic
+from .text_processing import tokenize
+from .token_budget import estimate_tokens
+from .vector_index import VECTOR_CACHE_DIR, HashingEmbedder, VectorIndex
+
+
+# Default prompt budget for the reference material of one question_config
+CONTEXT_TOKEN_BUDGET = 16000
+
+# Pages longer than this are split further at their markdown headings
+MAX_CHUNK_CHARS = 3000
+MIN_CHUNK_CHARS = 300
+
+# Reciprocal rank fusion constant for combining BM25 and dense rankings
+RRF_K = 60
+
+_PAGE_MARKER = re.compile(r'^#\s*Page Number:\s*(\S+)\s*$', re.IGNORECASE)
+_HEADING = re.compile(r'^#{1,6}\s+\S')
+
+# Nudges lexical retrieval towards the kind of material each difficulty needs
+DIFFICULTY_HINTS = {
+    "easy": "definition introduction define called known basic property",
+    "medium": "example solution relation compare explain find show",
+    "hard": "theorem proof derive derivation prove application exercise problem",
+}
+
+
+class Chunk(NamedTuple):
+    standard: str
+    subject: str
+    topic: str      # chapter title as stored in the knowledge base
+    page: str
+    heading: str
+    text: str
+
+
+def _split_sections(lines):
+    """Split one page into heading-led sections, merging the very short ones."""
+    sections = []
+    current = []
+    for line in lines:
+        if _HEADING.match(line) and len("\n".join(current)) >= MIN_CHUNK_CHARS:
+            sections.append(current)
+            current = []
+        current.append(line)
+    if current:
+        if sections and len("\n".join(current)) < MIN_CHUNK_CHARS:
+            sections[-1].extend(current)
+        else:
+            sections.append(current)
+    return sections
+
+
+def chunk_chapter(chapter):
+    """
+    Split a chapter's markdown into page chunks, and long pages into sections.
+
+    Args:
+        chapter (Chapter): A knowledge base chapter.
+
+    Returns:
+        list[Chunk]: Chunks in document order.
+    """
+    pages = []
+    page, lines = "", []
+    for line in chapter.markdown.splitlines():
+        marker = _PAGE_MARKER.match(line.strip())
+        if marker:
+            if any(l.strip() for l in lines):
+                pages.append((page, lines))
+            page, lines = marker.group(1), []
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines):
+        pages.append((page, lines))
+
+    chunks = []
+    for page, lines in pages:
+        sections = [lines] if len("\n".join(lines)) <= MAX_CHUNK_CHARS else _split_sections(lines)
+        for section in sections:
+            text = "\n".join(section).strip()
+            if not text:
+                continue
+            heading = next((l.lstrip("#").strip() for l in section if _HEADING.match(l)), "")
+            chunks.append(Chunk(chapter.standard, chapter.subject, chapter.topic, page, heading, text))
+    return chunks
+
+
+class BM25Index:
+    """In-memory Okapi BM25 inverted index over a list of chunks."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+
+        for chunk_id, chunk in enumerate(chunks):
+            terms = Counter(tokenize(f"{chunk.heading} {chunk.text}"))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((chunk_id, tf))
+
+        total = len(chunks)
+        self.avg_length = (sum(self.lengths) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def scores(self, query, candidates=None):
+        """BM25 score per chunk id for ``query``, optionally limited to ``candidates``."""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, tf in self.postings[term]:
+                if candidates is not None and chunk_id not in candidates:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / (self.avg_length or 1))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=10, candidates=None):
+        scores = self.scores(query, candidates)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+class _SubjectChunks:
+    def __init__(self, key, chapters, embedder, cache_dir):
+        self.chunks = []
+        self.by_topic = {}
+        for topic, chapter in chapters.items():
+            start = len(self.chunks)
+            self.chunks.extend(chunk_chapter(chapter))
+            self.by_topic[topic] = range(start, len(self.chunks))
+        self.bm25 = BM25Index(self.chunks)
+        self.vectors = VectorIndex.load_or_build(
+            [f"{chunk.heading}\n{chunk.text}" for chunk in self.chunks],
+            embedder,
+            name="_".join(key).replace(" ", "-"),
+            cache_dir=cache_dir,
+        )
+
+
+def render_chunks(chunks):
+    """
+    Assemble chunks back into reference markdown.
+
+    Chunks are grouped per chapter and kept in page order, with the original
+    "Chapter :" and "# Page Number:" markers so the model can cite sources.
+    """
+    markdown = ""
+    topic, page = None, None
+    for chunk in chunks:
+        if chunk.topic != topic:
+            topic, page = chunk.topic, None
+            markdown += "Chapter : " + topic + " \n \n "
+        if chunk.page != page:
+            page = chunk.page
+            markdown += f"# Page Number: {page}\n"
+        markdown += chunk.text + "\n\n"
+    return markdown
+
+
+class Retriever:
+    """
+    Chunk-level retrieval over the knowledge base.
+
+    Chapters are chunked and indexed once per (class, subject) and rebuilt
+    whenever the knowledge base store reloads. Each subject gets a BM25 index
+    and a dense vector index; their rankings are merged with reciprocal rank
+    fusion.
+    """
+
+    def __init__(self, store=knowledge_base, embedder=None, cache_dir=VECTOR_CACHE_DIR):
+        self.store = store
+        self.embedder = embedder or HashingEmbedder()
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._subjects = {}
+        self._version = None
+
+    def subject_index(self, standard, subject):
+        key = (normalize_key(standard), normalize_key(subject))
+        chapters = self.store.subject_chapters(*key)
+        with self._lock:
+            if self._version != self.store.version:
+                self._subjects = {}
+                self._version = self.store.version
+            index = self._subjects.get(key)
+            if index is None:
+                index = self._subjects[key] = _SubjectChunks(key, chapters, self.embedder, self.cache_dir)
+        return index
+
+    def rank(self, standard, subject, topics, queries):
+        """
+        Rank the chunks of the given chapters for each query.
+
+        Dense similarities for all queries are computed in one batched lookup.
+
+        Returns:
+            list[list[list[int]]]: Per query, per chapter, chunk ids ordered best first.
+        """
+        index = self.subject_index(standard, subject)
+        chapter_chunks = [index.by_topic.get(normalize_topic(topic), range(0)) for topic in topics]
+        candidates = sorted({chunk_id for chunk_ids in chapter_chunks for chunk_id in chunk_ids})
+        dense = index.vectors.search(queries, k=len(candidates), candidates=candidates)
+
+        ranked = []
+        for query, dense_hits in zip(queries, dense):
+            fused = {chunk_id: 1.0 / (RRF_K + rank + 1) for rank, (chunk_id, _) in enumerate(dense_hits)}
+            per_chapter = []
+            for chunk_ids in chapter_chunks:
+                lexical = index.bm25.scores(query, candidates=set(chunk_ids))
+                for rank, chunk_id in enumerate(sorted(lexical, key=lambda chunk_id: -lexical[chunk_id])):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                per_chapter.append(sorted(chunk_ids, key=lambda chunk_id: (-fused.get(chunk_id, 0.0), chunk_id)))
+            ranked.append(per_chapter)
+        return ranked
+
+    def select(self, index, ranked, token_budget):
+        """
+        Pick chunks round-robin across chapters until ``token_budget`` is used,
+        so every selected chapter is represented.
+        """
+        selected = []
+        used = 0
+        cursors = [0] * len(ranked)
+        progress = True
+        while progress:
+            progress = False
+            for position, chunk_ids in enumerate(ranked):
+                while cursors[position] < len(chunk_ids):
+                    chunk_id = chunk_ids[cursors[position]]
+                    cursors[position] += 1
+                    cost = estimate_tokens(index.chunks[chunk_id].text)
+                    if used + cost <= token_budget:
+                        selected.append((position, chunk_id))
+                        used += cost
+                        progress = True
+                        break
+        # Back to the requested chapter order and page order within each chapter
+        return [chunk_id for _, chunk_id in sorted(selected)]
+
+    def retrieve(self, standard, subject, topics, queries, token_budget=CONTEXT_TOKEN_BUDGET):
+        """
+        Reference markdown per question_config: the best matching chunks of
+        the selected chapters that fit within ``token_budget``.
+
+        Args:
+            standard (str): Class, e.g. "CLASS 10".
+            subject (str): Subject, e.g. "MATHS".
+            topics (list[str]): Chapter titles as stored in the knowledge base.
+            queries (list[str]): One text per question_config describing what
+                its questions should cover.
+            token_budget (int | list[int]): Maximum estimated tokens of
+                reference text, for all queries or one per query.
+
+        Returns:
+            list[str]: Markdown with chapter and page markers, one per query.
+        """
+        return [
+            slices[0]
+            for slices in self.retrieve_slices(standard, subject, topics, queries, 1, token_budget)
+        ]
+
+    def retrieve_slices(self, standard, subject, topics, queries, slices, token_budget=CONTEXT_TOKEN_BUDGET):
+        """
+        Like ``retrieve``, but splits each query's ranking into disjoint slices.
+
+        Slice ``s`` of ``n`` takes every n-th chunk of each chapter's ranking
+        starting at ``s``, so sub-batches of one section see different pages
+        while each still gets a share of the best matches. A chapter with
+        fewer than ``n`` chunks is split into as many slices as it has chunks,
+        and the remaining slices reuse them, so no slice is left empty.
+
+        Args:
+            slices (int | list[int]): Number of slices, for all queries or one per query.
+
+        Returns:
+            list[list[str]]: Per query, one markdown per slice.
+        """
+        index = self.subject_index(standard, subject)
+        budgets = token_budget if isinstance(token_budget, (list, tuple)) else [token_budget] * len(queries)
+        counts = slices if isinstance(slices, (list, tuple)) else [slices] * len(queries)
+
+        results = []
+        for ranked, budget, count in zip(self.rank(standard, subject, topics, queries), budgets, counts):
+            count = max(1, count)
+            results.append([
+                render_chunks([
+                    index.chunks[chunk_id]
+                    for chunk_id in self.select(index, [_slice(chunk_ids, offset, count) for chunk_ids in ranked], budget)
+                ])
+                for offset in range(count)
+            ])
+        return results
+
+
+def _slice(chunk_ids, offset, count):
+    count = min(count, len(chunk_ids)) or 1
+    return chunk_ids[offset % count::count]
+
+
+def section_query(topics, question_config, user_query=""):
+    """Retrieval query for one question_config: chapters, difficulty hints and the educator's text."""
+    difficulty = str(question_config.get("difficulty") or "").lower()
+    return " ".join([
+        " ".join(normalize_topic(topic) for topic in topics),
+        DIFFICULTY_HINTS.get(difficulty, ""),
+        user_query or "",
+    ])
+
+
+retriever = Retriever()
@@ -1,17 +1,50 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from db.database import get_db_session
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import json
+import weakref
 from auth.jwt_utils import get_current_user
-from chat.utils import get_bot_reponse
+from chat.jobs import job_manager, FINISHED, SUCCEEDED
+from chat.schemas import question_schema, validate_question
+from chat.utils import edit_paper, get_bot_reponse, is_paper_request, locate_question, paper_message, stream_paper, variant_papers
+from chat.variants import MAX_VARIANTS, NotEnoughVariants
+from chat.worker_pool import WorkerPoolSaturated
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+# Reply when the worker or render pool queue is full (WorkerPoolSaturated)
+BUSY_MESSAGE = "Server is busy generating other papers, please retry shortly"
+
+# One lock per job being edited; an entry goes away once no request holds it
+_job_edit_locks = weakref.WeakValueDictionary()
+
+def job_edit_lock(job_id):
+    """Lock serializing the read-modify-write of a job's result by concurrent edits."""
+    lock = _job_edit_locks.get(job_id)
+    if lock is None:
+        lock = _job_edit_locks[job_id] = asyncio.Lock()
+    return lock
+
 class SubmitResponse(BaseModel):
     success: bool
     bot: dict
     type: str
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    progress: dict
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+class EditQuestionRequest(BaseModel):
+    question: dict  # Fields to change, e.g. {"question": "...", "answer": "b"}
+
 class SubmitMessageRequest(BaseModel):
     curriculum: dict
     standard: dict
@@ -19,18 +52,38 @@ class SubmitMessageRequest(BaseModel):
     topics: list[dict]
     question_config: list[dict]
     query: str
+    variants: Optional[int] = None  # Shuffled sets (A, B, ...) to produce with the paper
+    latency_slo_seconds: Optional[float] = None  # Target seconds per generation call; slow sections move to flash
+
+class VariantsRequest(BaseModel):
+    count: int = 4
+    seed: Optional[str] = None
+
+def check_variant_count(count):
+    if not 1 <= count <= MAX_VARIANTS:
+        raise HTTPException(status_code=422, detail=f"Between 1 and {MAX_VARIANTS} sets can be created")
 
 @router.post("/submit", response_model=SubmitResponse)
 async def submit_message(
     payload: SubmitMessageRequest,
+    wait: bool = False,
     db: Session = Depends(get_db_session),
     current_user: dict = Depends(get_current_user)
 ):
-    """Handle user message and create next chat based on the flow."""
+    """
+    Handle user message and create next chat based on the flow.
+
+    Paper generation itself is enqueued as a job: the response carries the
+    job ID to poll at /chat/jobs/{job_id}. With ``wait=true`` the request
+    waits for the job instead, but the job keeps running if the client goes away.
+    """
     # Verify user is an educator
     if current_user["type"] != "educator":
         raise HTTPException(status_code=403, detail="Only educators can access chat")
     
+    if payload.variants is not None:
+        check_variant_count(payload.variants)
+
     educator_id = current_user["sub"]
     req_body = {
         "educator_id": educator_id,
@@ -40,13 +93,249 @@ async def submit_message(
         "topics": payload.topics, 
         "question_config": payload.question_config,
         "user": educator_id,
-        "query": payload.query
+        "query": payload.query,
+        "variants": payload.variants,
+        "latency_slo_seconds": payload.latency_slo_seconds
     }
     
-    new_bot_message = get_bot_reponse(req_body)
+    if is_paper_request(req_body):
+        job = await job_manager.submit(educator_id, req_body)
+
+        if not wait:
+            return SubmitResponse(
+                success=True,
+                bot={
+                    "text": "Your question paper is being generated. This can take a minute.",
+                    "items": [{"job_id": job["id"], "status": job["status"]}]
+                },
+                type="generation_job"
+            )
+
+        job = await job_manager.wait(job["id"])
+        if job["status"] != "succeeded":
+            new_bot_message = {
+                "bot": {
+                    "text": "Our servers encountered an error! We are looking into it. Thank you.",
+                    "items": []
+                },
+                "type": "default"
+            }
+        else:
+            new_bot_message = job["result"]
+
+        return SubmitResponse(
+            success=True,
+            bot=new_bot_message["bot"] or {},
+            type=new_bot_message["type"] or ''
+        )
+
+    try:
+        new_bot_message = await get_bot_reponse(req_body)
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail=BUSY_MESSAGE)
     print(new_bot_message)
     return SubmitResponse(
         success=True,
         bot=new_bot_message["bot"] or {},
         type=new_bot_message["type"] or ''
-    )
\ No newline at end of file
+    )
+
+@router.post("/submit/stream")
+async def submit_message_stream(
+    payload: SubmitMessageRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Generate the question paper and stream it as server-sent events.
+
+    Each question is sent as a "question" event as soon as the model has
+    produced it; the final "paper" event carries the signed PDF URLs, and
+    a "variants" event the shuffled sets if any were asked for.
+    """
+    if current_user["type"] != "educator":
+        raise HTTPException(status_code=403, detail="Only educators can access chat")
+
+    if payload.variants is not None:
+        check_variant_count(payload.variants)
+
+    educator_id = current_user["sub"]
+    req_body = {
+        "educator_id": educator_id,
+        "curriculum": payload.curriculum,
+        "standard": payload.standard,
+        "subject": payload.subject,
+        "topics": payload.topics,
+        "question_config": payload.question_config,
+        "user": educator_id,
+        "query": payload.query,
+        "variants": payload.variants,
+        "latency_slo_seconds": payload.latency_slo_seconds
+    }
+
+    if not is_paper_request(req_body):
+        raise HTTPException(status_code=400, detail="Standard, subject and question_config are required to stream a paper")
+
+    async def event_stream():
+        try:
+            async for event in stream_paper(req_body):
+                name = event.pop("event")
+                yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=True)}\n\n"
+        except WorkerPoolSaturated:
+            yield f"event: error\ndata: {json.dumps({'message': BUSY_MESSAGE})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_generation_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-stage progress of a paper generation job and, once done, its signed URLs."""
+    job = await job_manager.get(job_id)
+
+    if job is None or str(job["educator_id"]) != str(current_user["sub"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return JobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        result=job["result"] if job["status"] in FINISHED else None,
+        error=job["error"]
+    )
+
+@router.post("/jobs/{job_id}/repair", response_model=SubmitResponse)
+async def repair_generation_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Re-run a finished job for only what it is missing.
+
+    Questions the job already delivered are kept and only the short or
+    failed sections are generated again, as a new job.
+    """
+    job = await job_manager.get(job_id)
+
+    if job is None or str(job["educator_id"]) != str(current_user["sub"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job["status"] not in FINISHED:
+        raise HTTPException(status_code=409, detail="Job is still running")
+
+    result = job["result"] or {}
+    sections = result.get("sections") or []
+    if result and not result.get("incomplete"):
+        raise HTTPException(status_code=409, detail="Paper is already complete")
+
+    request = dict(job["request"])
+    request.pop("salvaged", None)
+    if len(sections) == len(request["question_config"]):
+        request["salvaged"] = [section.get("questions") or [] for section in sections]
+
+    repair_job = await job_manager.submit(job["educator_id"], request)
+
+    return SubmitResponse(
+        success=True,
+        bot={
+            "text": "Generating the missing questions of your paper.",
+            "items": [{"job_id": repair_job["id"], "status": repair_job["status"]}]
+        },
+        type="generation_job"
+    )
+
+@router.patch("/jobs/{job_id}/questions/{number}", response_model=JobResponse)
+async def edit_generation_job_question(
+    job_id: str,
+    number: int,
+    payload: EditQuestionRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Edit question ``number`` (as numbered on the paper) of a generated paper.
+
+    The given fields replace the question's, the PDFs are rendered again
+    (reusing the unchanged questions) and the job's result carries the new
+    signed URLs. Edits of the same job are applied one at a time.
+    """
+    async with job_edit_lock(job_id):
+        job = await job_manager.get(job_id)
+
+        if job is None or str(job["educator_id"]) != str(current_user["sub"]):
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        result = job["result"] or {}
+        if job["status"] != SUCCEEDED or not result.get("sections"):
+            raise HTTPException(status_code=409, detail="Job has no paper to edit")
+
+        position = locate_question(result["sections"], number)
+        if position is None:
+            raise HTTPException(status_code=404, detail="Question not found")
+
+        section_index, question_index = position
+        questions = result["sections"][section_index]["questions"]
+        question_config = job["request"]["question_config"][section_index]
+        edited = validate_question({**questions[question_index], **payload.question}, question_schema(question_config))
+        if edited is None:
+            raise HTTPException(status_code=422, detail="Edited question does not match the section's question format")
+        questions[question_index] = edited
+
+        try:
+            job["result"] = await edit_paper(result, job["request"]["subject"]["name"])
+        except WorkerPoolSaturated:
+            raise HTTPException(status_code=503, detail=BUSY_MESSAGE)
+        await job_manager.update(job)
+
+    return JobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        result=job["result"],
+        error=job["error"]
+    )
+
+@router.post("/jobs/{job_id}/variants", response_model=JobResponse)
+async def create_generation_job_variants(
+    job_id: str,
+    payload: VariantsRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Shuffled sets (A, B, ...) of a generated paper, without generating any
+    new questions. The same seed gives the same sets, and no two sets are
+    the same (400 if the paper is too small for that many); the job's
+    result carries their signed URLs.
+    """
+    async with job_edit_lock(job_id):
+        job = await job_manager.get(job_id)
+
+        if job is None or str(job["educator_id"]) != str(current_user["sub"]):
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        result = job["result"] or {}
+        if job["status"] != SUCCEEDED or not result.get("sections"):
+            raise HTTPException(status_code=409, detail="Job has no paper to shuffle")
+
+        check_variant_count(payload.count)
+
+        try:
+            variants = await variant_papers(result["sections"], job["request"]["subject"]["name"], payload.count, payload.seed or job["id"])
+        except NotEnoughVariants as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except WorkerPoolSaturated:
+            raise HTTPException(status_code=503, detail=BUSY_MESSAGE)
+
+        job["result"] = paper_message(result.get("question_url"), result.get("answer_url"), result.get("incomplete", False), result["sections"], variants)
+        await job_manager.update(job)
+
+    return JobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        result=job["result"],
+        error=job["error"]
+    )
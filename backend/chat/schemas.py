@@ -0,0 +1,103 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+
+# Output schemas of the Gemini prompts. They are passed to Vertex as
+# ``response_schema`` (with ``response_mime_type="application/json"``), so the
+# field descriptions are part of the prompt.
+
+
+class NamedValue(BaseModel):
+    id: str = Field("", description="Same as name, or empty if not mentioned")
+    name: str = Field("", description="Upper case, e.g. CLASS 10 or MATHS; empty if not mentioned or not supported")
+
+
+class ClassSubject(BaseModel):
+    relevant: bool = Field(description="False if the query is not about creating a question paper")
+    standard: NamedValue
+    subject: NamedValue
+
+
+class ExamSpecification(BaseModel):
+    difficulty: str = Field("", description="easy, medium or hard; empty if not mentioned")
+    type: str = Field("", description="MCQ or Subjective; empty if not mentioned")
+    questions: int = Field(0, description="Number of questions; 0 if not mentioned")
+    marks: int = Field(0, description="Marks per question; 0 if not mentioned")
+
+
+class Source(BaseModel):
+    chapter: str
+    page_numbers: List[int]
+
+
+class McqOptions(BaseModel):
+    a: str
+    b: str
+    c: str
+    d: str
+
+
+class McqQuestion(BaseModel):
+    question: str = Field(description="Question text ending with its marks in square brackets, e.g. [Marks 5]")
+    options: McqOptions
+    answer: Literal["a", "b", "c", "d"] = Field(description="Key of the correct option")
+    reason: str = Field(description="Why the answer is correct and the other options are not")
+    difficulty: Literal["Easy", "Medium", "Hard"]
+    source: List[Source] = Field(description="Chapters and pages the question is based on")
+
+
+class SubjectiveQuestion(BaseModel):
+    question: str = Field(description="Question text ending with its marks in square brackets, e.g. [Marks 5]")
+    answer: str = Field(description="Key points or ideas needed for full marks")
+    difficulty: Literal["Easy", "Medium", "Hard"]
+    source: List[Source] = Field(description="Chapters and pages the question is based on")
+
+
+# Built once: pydantic-core validates straight from the response text
+_class_subject = TypeAdapter(ClassSubject)
+_exam_specifications = TypeAdapter(List[ExamSpecification])
+_question_lists = {
+    McqQuestion: TypeAdapter(List[McqQuestion]),
+    SubjectiveQuestion: TypeAdapter(List[SubjectiveQuestion]),
+}
+
+
+def question_schema(question_config):
+    """The question model of a section."""
+    if str(question_config.get('type') or "").lower() == "mcq":
+        return McqQuestion
+    return SubjectiveQuestion
+
+
+def parse_class_subject_output(text):
+    """The class/subject dict of a structured response, or None for irrelevant queries."""
+    result = _class_subject.validate_json(text)
+    if not result.relevant:
+        return None
+    return result.model_dump(exclude={"relevant"})
+
+
+def parse_exam_specifications_output(text):
+    """The exam specifications of a structured response, or None if there are none."""
+    specifications = _exam_specifications.validate_json(text)
+    return [specification.model_dump() for specification in specifications] or None
+
+
+def validate_questions(text, schema):
+    """
+    Questions of a structured response as dicts, or None if the text does
+    not match ``schema`` as a whole.
+    """
+    try:
+        return [question.model_dump() for question in _question_lists[schema].validate_json(text)]
+    except ValidationError:
+        return None
+
+
+def validate_question(question, schema):
+    """One already parsed question as a dict, or None if it does not match ``schema``."""
+    try:
+        return schema.model_validate(question).model_dump()
+    except ValidationError:
+        return None
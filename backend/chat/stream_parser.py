@@ -0,0 +1,143 @@
+import json
+import re
+from typing import NamedTuple
+
+
+_FENCE = re.compile(r'^\s*```[A-Za-z]*\s*|\s*```\s*$')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+def loads_lenient(text):
+    """
+    ``json.loads`` that tolerates surrounding code fences, raw newlines and
+    tabs inside strings, and trailing commas before a closing bracket.
+    Raises ValueError if the text still does not parse.
+    """
+    text = _FENCE.sub("", text or "").strip()
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+
+
+class IncrementalArrayParser:
+    """
+    Incremental parser for a streamed JSON array of objects.
+
+    Text is fed as it arrives from the model; every object of the top-level
+    array is returned from ``feed`` as soon as its closing brace is seen.
+    Anything before the array (e.g. a stray code fence) is ignored, and a bare
+    top-level object is treated as a one-item array.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._item_depth = None
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self.errors = []
+        self.count = 0
+        self.repaired = 0
+
+    def feed(self, chunk):
+        """
+        Args:
+            chunk (str): The next piece of model output.
+
+        Returns:
+            list[dict]: Objects completed by this chunk.
+        """
+        if not chunk:
+            return []
+
+        self._text += chunk
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif char in "[{":
+                if self._item_depth is None:
+                    self._item_depth = 2 if char == "[" else 1
+                self._depth += 1
+                if char == "{" and self._depth == self._item_depth:
+                    self._start = i
+            elif char in "]}":
+                if char == "}" and self._depth == self._item_depth and self._start is not None:
+                    raw = text[self._start:i + 1]
+                    self._start = None
+                    try:
+                        item = self._loads(raw)
+                    except ValueError as e:
+                        self.errors.append(f"{e}: {raw[:80]}")
+                    else:
+                        if isinstance(item, dict):
+                            items.append(item)
+                            self.count += 1
+                self._depth = max(0, self._depth - 1)
+
+        # Drop consumed text so long streams are scanned only once
+        keep_from = self._start if self._start is not None else len(text)
+        self._text = text[keep_from:]
+        self._pos = len(text) - keep_from
+        if self._start is not None:
+            self._start = 0
+        return items
+
+    def _loads(self, raw):
+        try:
+            return json.loads(raw, strict=False)
+        except ValueError:
+            item = loads_lenient(raw)
+            self.repaired += 1
+            return item
+
+    @property
+    def pending(self):
+        """Text of an object that has started but not yet closed."""
+        return self._text if self._start is not None else ""
+
+
+class ParsedQuestions(NamedTuple):
+    questions: list
+    repaired: int   # objects that only parsed after fixing syntax faults
+    dropped: int    # objects that could not be recovered
+    truncated: bool # the output ended inside an object
+
+
+def parse_question_list(text):
+    """
+    Questions from a complete model response.
+
+    Well-formed output takes the plain ``json.loads`` path. Otherwise every
+    complete object of the array is recovered on its own, so a trailing
+    comma or a response cut off in its last question costs only the
+    affected questions; the report says how many were lost, and callers
+    re-request just the remainder.
+    """
+    try:
+        value = json.loads(_FENCE.sub("", text or "").strip(), strict=False)
+    except ValueError:
+        value = None
+
+    if isinstance(value, dict):
+        value = value["questions"] if isinstance(value.get("questions"), list) else [value]
+    if isinstance(value, list):
+        questions = [item for item in value if isinstance(item, dict)]
+        return ParsedQuestions(questions, 0, len(value) - len(questions), False)
+
+    parser = IncrementalArrayParser()
+    questions = parser.feed(text or "")
+    return ParsedQuestions(questions, parser.repaired, len(parser.errors), bool(parser.pending))
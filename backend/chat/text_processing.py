@@ -0,0 +1,16 @@
+import re
+
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+_STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in is it its of on or that the
+    this to was were will with which what when where who how than then there
+    these those their them they we you your can may also not but if into
+    question questions marks mark mcq subjective paper generate please
+""".split())
+
+
+def tokenize(text):
+    """Lowercase alphanumeric terms of ``text`` without stopwords and single characters."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS and len(token) > 1]
@@ -0,0 +1,161 @@
+import json
+import os
+import re
+from typing import NamedTuple
+
+from .text_processing import tokenize
+
+
+class ModelLimits(NamedTuple):
+    context_tokens: int     # input + output window of the model
+    max_output_tokens: int
+    prompt_cap_tokens: int  # prompt size we allow to keep per-call latency predictable
+
+
+MODEL_LIMITS = {
+    "gemini-2.5-pro": ModelLimits(context_tokens=1_048_576, max_output_tokens=65_536, prompt_cap_tokens=24_000),
+    "gemini-2.5-flash": ModelLimits(context_tokens=1_048_576, max_output_tokens=65_536, prompt_cap_tokens=24_000),
+}
+DEFAULT_LIMITS = ModelLimits(context_tokens=32_768, max_output_tokens=8_192, prompt_cap_tokens=16_000)
+
+# Expected output size per generated question, including reason/answer text
+OUTPUT_TOKENS_PER_QUESTION = {
+    "mcq": 300,
+    "subjective": 450,
+}
+
+# Reference material never shrinks below this, however small the model
+MIN_REFERENCE_TOKENS = 2_000
+
+# Retrieved reference per requested question, about a page of the chapter each
+REFERENCE_TOKENS_PER_QUESTION = int(os.getenv("REFERENCE_TOKENS_PER_QUESTION", "1000"))
+
+# Reserved for the generation instructions when the exact prompt is not known yet
+INSTRUCTION_TOKENS = 1_500
+
+_SECTION_START = re.compile(r'^(Chapter : .*|#\s*Page Number:.*)$', re.MULTILINE)
+
+
+def estimate_tokens(text):
+    """Rough token count for Gemini models (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def model_limits(model):
+    return MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+
+
+def _config_dict(question_config):
+    if isinstance(question_config, str):
+        try:
+            return json.loads(question_config)
+        except ValueError:
+            return {}
+    return question_config or {}
+
+
+def desired_output_tokens(model, question_config):
+    """Output tokens to reserve for one question_config on ``model``."""
+    config = _config_dict(question_config)
+    per_question = OUTPUT_TOKENS_PER_QUESTION.get(str(config.get("type") or "").lower(), OUTPUT_TOKENS_PER_QUESTION["subjective"])
+    questions = int(config.get("questions") or 1)
+    return min(per_question * questions, model_limits(model).max_output_tokens)
+
+
+def reference_budget(model, question_config, fixed_prompt=None):
+    """
+    Tokens available for reference markdown in one generation call.
+
+    Args:
+        model (str): Gemini model name.
+        question_config (dict | str): The section being generated.
+        fixed_prompt (str): Instructions and other prompt text sent alongside
+            the references. When omitted, ``INSTRUCTION_TOKENS`` are reserved.
+
+    Returns:
+        int: Token budget for the reference material.
+    """
+    limits = model_limits(model)
+    available = min(limits.prompt_cap_tokens, limits.context_tokens - desired_output_tokens(model, question_config))
+    overhead = INSTRUCTION_TOKENS if fixed_prompt is None else estimate_tokens(fixed_prompt)
+    return max(available - overhead, MIN_REFERENCE_TOKENS)
+
+
+def retrieval_budget(model, question_config):
+    """
+    Tokens of reference to retrieve for one generation call: the top chunks
+    for ``REFERENCE_TOKENS_PER_QUESTION`` per question, at least
+    ``MIN_REFERENCE_TOKENS`` and never more than ``reference_budget`` allows.
+    """
+    questions = int(_config_dict(question_config).get("questions") or 1)
+    wanted = max(REFERENCE_TOKENS_PER_QUESTION * questions, MIN_REFERENCE_TOKENS)
+    return min(wanted, reference_budget(model, question_config))
+
+
+def split_sections(markdown):
+    """
+    Split reference markdown into (chapter header, section text) pairs at its
+    "Chapter :" and "# Page Number:" markers.
+    """
+    sections = []
+    chapter = ""
+    starts = [match.start() for match in _SECTION_START.finditer(markdown)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    for start, end in zip(starts, starts[1:] + [len(markdown)]):
+        text = markdown[start:end]
+        if text.startswith("Chapter : "):
+            header, _, text = text.partition("\n")
+            chapter = header + "\n \n "
+            text = text.lstrip("\n ")
+        if text.strip():
+            sections.append((chapter, text))
+    return sections
+
+
+def fit_markdown(markdown, budget, query="", label=""):
+    """
+    Trim reference markdown to ``budget`` tokens.
+
+    Sections are ranked by their term overlap with ``query`` (document order
+    breaks ties), the best ones are kept and re-emitted in their original
+    order. The number of dropped tokens is logged.
+
+    Returns:
+        str: Markdown that fits the budget.
+    """
+    total = estimate_tokens(markdown)
+    if total <= budget:
+        return markdown
+
+    sections = split_sections(markdown)
+    query_terms = set(tokenize(query))
+
+    def score(item):
+        position, (_, text) = item
+        terms = tokenize(text)
+        overlap = sum(1 for term in terms if term in query_terms) / (len(terms) or 1)
+        return (-overlap, position)
+
+    kept = []
+    used = 0
+    chapters_used = set()
+    for position, (chapter, text) in sorted(enumerate(sections), key=score):
+        cost = estimate_tokens(text) + (0 if chapter in chapters_used else estimate_tokens(chapter))
+        if used + cost > budget:
+            continue
+        kept.append(position)
+        chapters_used.add(chapter)
+        used += cost
+
+    trimmed = ""
+    current_chapter = None
+    for position in sorted(kept):
+        chapter, text = sections[position]
+        if chapter != current_chapter:
+            current_chapter = chapter
+            trimmed += chapter
+        trimmed += text
+
+    print(f"Token budget{f' ({label})' if label else ''}: kept {estimate_tokens(trimmed)} of {total} reference tokens, dropped {total - estimate_tokens(trimmed)}")
+    return trimmed
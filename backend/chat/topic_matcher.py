@@ -0,0 +1,108 @@
+import threading
+from typing import NamedTuple
+
+from .knowledge_base import knowledge_base, normalize_key, normalize_topic
+
+
+# Length of the substrings indexed per title
+_GRAM = 3
+
+
+class TopicResolution(NamedTuple):
+    matches: dict      # requested topic -> Chapter
+    ambiguous: dict    # requested topic -> [Chapter, ...] (first one is used in matches)
+    missing: list      # requested topics with no chapter
+
+
+class _SubjectIndex:
+    """
+    Lowercase keys and a trigram index over the chapter titles of one (class, subject).
+
+    ``grams`` maps every 3-character substring of a title to the chapters
+    (in KB order) whose title has it. A title containing a needle has all
+    of the needle's trigrams, so only the chapters in every one of their
+    lists are compared with the needle. Building is linear in the total
+    title length.
+    """
+
+    def __init__(self, chapters):
+        self.exact = dict(chapters)
+        self.chapters = list(chapters.values())
+        self.titles = [normalize_key(chapter.topic) for chapter in self.chapters]
+        self.grams = {}
+        for index, title in enumerate(self.titles):
+            for gram in {title[i:i + _GRAM] for i in range(len(title) - _GRAM + 1)}:
+                self.grams.setdefault(gram, []).append(index)
+
+    def containing(self, needle):
+        """Indexes of the chapters whose title contains ``needle``, in KB order."""
+        if len(needle) < _GRAM:
+            candidates = range(len(self.titles))
+        else:
+            postings = sorted(
+                (self.grams.get(needle[i:i + _GRAM], ()) for i in range(len(needle) - _GRAM + 1)),
+                key=len,
+            )
+            candidates = sorted(set(postings[0]).intersection(*postings[1:]))
+        return [index for index in candidates if needle in self.titles[index]]
+
+
+# Subjects the knowledge base has no chapters for
+_EMPTY = _SubjectIndex({})
+
+
+class TopicMatcher:
+    """
+    Resolves all requested topics of a paper against the knowledge base at once.
+
+    Per (class, subject) the lowercase chapter keys and a trigram index over
+    the chapter titles are built once in ``reload`` from the store. Exact
+    normalized names resolve through a dict; the rest are looked up in the
+    trigram index, keeping the legacy "requested topic is contained in the
+    chapter title" semantics.
+    """
+
+    def __init__(self, store=knowledge_base):
+        self.store = store
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._version = None
+
+    def reload(self):
+        """Rebuild the indexes of every subject; called after the store is (re)loaded."""
+        version = self.store.version
+        indexes = {key: _SubjectIndex(chapters) for key, chapters in self.store.subjects().items()}
+        with self._lock:
+            self._indexes = indexes
+            self._version = version
+        return len(indexes)
+
+    def _index(self, standard, subject):
+        if self._version != self.store.version:
+            self.reload()
+        return self._indexes.get((normalize_key(standard), normalize_key(subject)), _EMPTY)
+
+    def resolve(self, standard, subject, topics) -> TopicResolution:
+        index = self._index(standard, subject)
+
+        matches = {}
+        ambiguous = {}
+        for topic in topics:
+            chapter = index.exact.get(normalize_topic(topic))
+            if chapter is not None:
+                matches[topic] = chapter
+                continue
+            needle = normalize_key(topic)
+            if not needle:
+                continue
+            chapter_indexes = index.containing(needle)
+            if not chapter_indexes:
+                continue
+            matches[topic] = index.chapters[chapter_indexes[0]]
+            if len(chapter_indexes) > 1:
+                ambiguous[topic] = [index.chapters[i] for i in chapter_indexes]
+
+        missing = [topic for topic in topics if topic not in matches]
+        return TopicResolution(matches=matches, ambiguous=ambiguous, missing=missing)
+
+topic_matcher = TopicMatcher()
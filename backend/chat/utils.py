@@ -1,7 +1,11 @@
 
 
-from .prompt_processor import class_subject_prompt, extract_exam_specifications_prompt, generate_question_paper
+from .prompt_processor import class_subject_prompt, extract_exam_specifications_prompt, agenerate_question_paper, astream_question_paper, arender_paper, arender_variants
+from .variants import NotEnoughVariants, make_variants
+from .vertex_client import CircuitOpenError
+from .worker_pool import worker_pool
 from google.cloud import storage
+import asyncio
 import os
 
 
@@ -9,9 +13,9 @@ DEFAULT_MESSAGE = """Hello! I'm your dedicated AI assistant, here to simplify an
 
 To help me create the perfect question paper for your students, please let me know the standard (e.g., Class 10, Class 12) and the subject (e.g., Maths, Physics) you're preparing for. Once I have this basic information, we can then refine the paper with specific topics, question types, and difficulty levels."""
 
-def get_bot_reponse(req_body):
+async def get_bot_reponse(req_body):
     if len(list(req_body['standard'].keys())) == 0:
-        response = class_subject_prompt(req_body["query"])
+        response = await worker_pool.run(class_subject_prompt, req_body["query"])
         if response == None:
             return {
                     "bot": {
@@ -33,7 +37,7 @@ def get_bot_reponse(req_body):
         
     elif len(req_body['question_config']) == 0:
 
-        response = extract_exam_specifications_prompt(req_body["query"])
+        response = await worker_pool.run(extract_exam_specifications_prompt, req_body["query"])
 
         if response == None:
             return {
@@ -56,9 +60,9 @@ def get_bot_reponse(req_body):
     
     """
 
-    response, question_paper_path, answer_sheet_path, subject = generate_question_paper(req_body)
+    result = await generate_paper(req_body)
 
-    if response == None:
+    if result == None:
         return {
                     "bot": {
                         "text": "Our servers encountered an error! We are looking into it. Thank you.",
@@ -66,7 +70,191 @@ def get_bot_reponse(req_body):
                     },
                     "type": "default"
                 }
-    
+
+    return result
+
+
+def is_paper_request(req_body):
+    """True when the chat turn carries everything needed to generate the paper itself."""
+    return len(list(req_body['standard'].keys())) != 0 and len(req_body['question_config']) != 0
+
+
+async def generate_paper(req_body, on_stage=None):
+    """
+    Full paper pipeline: retrieve -> generate -> render -> upload.
+
+    Args:
+        req_body (dict): The chat request with curriculum, standard, subject, topics and question_config,
+            optionally "salvaged" questions per section from an earlier attempt, and optionally
+            the number of shuffled "variants" (sets A, B, ...) to produce as well.
+        on_stage: Optional coroutine function called with each stage name as it starts.
+
+    Returns:
+        dict: The bot message plus the signed URLs and per-section results, or None if no questions were generated.
+    """
+    response, question_pdf, answer_pdf, subject, sections = await agenerate_question_paper(req_body, on_stage=on_stage)
+
+    if response == None:
+        return None
+
+    incomplete = any(section["status"] != "complete" for section in sections)
+
+    if on_stage is not None:
+        await on_stage("upload")
+
+    question_url, answer_url = await upload_paper(question_pdf, answer_pdf, subject)
+
+
+    variants = None
+    if req_body.get("variants"):
+        variants = await requested_variants(sections, subject, req_body["variants"])
+
+    # Return the signed URLs, plus per-section results so the paper can be repaired or edited later
+    return paper_message(question_url, answer_url, incomplete, sections, variants)
+
+
+def paper_message(question_url, answer_url, incomplete, sections, variants=None):
+    """The bot message of a generated paper, with its shuffled sets if there are any."""
+    text = f"Please find the files generated here \n\nQuestion Paper: {question_url} \n\nAnswer Sheet: {answer_url}"
+    for variant in (variants or {}).get("sets", []):
+        text += f"\n\nSet {variant['set']}: {variant['question_url']} \n\nSet {variant['set']} Answer Sheet: {variant['answer_url']}"
+    if incomplete:
+        text += "\n\nSome sections have fewer questions than requested. You can repair the paper to generate only the missing ones."
+    if any(section.get("error") for section in sections):
+        text += " Question generation is temporarily unavailable for some of them, please retry shortly."
+    if (variants or {}).get("error"):
+        text += f"\n\n{variants['error']}, so no shuffled sets were made."
+
+    message = {
+        "bot": {
+            "text": text,
+            "items": []
+        },
+        "type": "default",
+        "question_url": question_url,
+        "answer_url": answer_url,
+        "incomplete": incomplete,
+        "sections": sections,
+    }
+    if variants:
+        message["variants"] = variants
+    return message
+
+
+async def variant_papers(sections, subject, count, seed):
+    """
+    Shuffled versions (sets A, B, ...) of a generated paper: questions and
+    MCQ options reordered per set, answers remapped, all sets rendered in
+    one batch and uploaded. No further model calls are made.
+
+    Args:
+        sections (list[dict]): Per-section results with their "questions".
+        count (int): Number of sets.
+        seed (str): Base seed; the same seed gives the same sets.
+
+    Returns:
+        dict: The seed and, per set, its label and signed URLs.
+
+    Raises:
+        NotEnoughVariants: The paper cannot be shuffled into ``count`` different sets.
+    """
+    variants = make_variants([section.get("questions") or [] for section in sections], count, seed)
+    rendered = await arender_variants(variants, subject)
+    urls = await asyncio.gather(*(
+        upload_paper(question_pdf, answer_pdf, f"{subject}_set_{label}")
+        for (label, _), (question_pdf, answer_pdf) in zip(variants, rendered)
+    ))
+    return {
+        "seed": seed,
+        "sets": [
+            {"set": label, "question_url": question_url, "answer_url": answer_url}
+            for (label, _), (question_url, answer_url) in zip(variants, urls)
+        ],
+    }
+
+
+async def requested_variants(sections, subject, count):
+    """
+    The shuffled sets asked for along with a new paper. A paper too small
+    for that many different sets gets none, and the reason as "error".
+    """
+    try:
+        return await variant_papers(sections, subject, count, seed=os.urandom(8).hex())
+    except NotEnoughVariants as e:
+        print(f"No shuffled sets: {e}")
+        return {"seed": None, "sets": [], "error": str(e)}
+
+
+def locate_question(sections, number):
+    """
+    Section and position of question ``number`` (1-based, numbered across
+    sections as on the rendered paper), or None if the paper has no such question.
+    """
+    for section_index, section in enumerate(sections):
+        questions = section.get("questions") or []
+        if number <= len(questions):
+            return (section_index, number - 1) if number >= 1 else None
+        number -= len(questions)
+    return None
+
+
+async def edit_paper(result, subject):
+    """
+    Re-render and upload a paper whose questions were edited in ``result["sections"]``.
+    Its shuffled sets, if it has any, are made again from the edited
+    questions with the same seed and count.
+
+    Returns:
+        dict: The updated bot message with the new signed URLs.
+    """
+    sections = result["sections"]
+    master_json = [section.get("questions") for section in sections if section.get("questions")]
+    question_pdf, answer_pdf = await arender_paper(master_json, subject, edit=True)
+    question_url, answer_url = await upload_paper(question_pdf, answer_pdf, subject)
+
+    variants = result.get("variants")
+    if variants and variants["sets"]:
+        variants = await variant_papers(sections, subject, len(variants["sets"]), variants["seed"])
+    return paper_message(question_url, answer_url, result.get("incomplete", False), sections, variants)
+
+
+async def stream_paper(req_body):
+    """
+    Streaming paper pipeline for /chat/submit/stream.
+
+    Forwards every section/question event from generation, then renders and
+    uploads the PDFs and finishes with a "paper" event carrying the signed
+    URLs, or an "error" event. With "variants" in ``req_body`` a "variants"
+    event with the shuffled sets follows the paper.
+    """
+    master_json = []
+    try:
+        async for event in astream_question_paper(req_body):
+            if event["event"] == "generated":
+                master_json = event["sections"]
+            else:
+                yield event
+    except CircuitOpenError as e:
+        yield {"event": "error", "message": f"Question generation is temporarily unavailable, please retry shortly. ({e})"}
+        return
+
+    if len(master_json) == 0:
+        yield {"event": "error", "message": "Our servers encountered an error! We are looking into it. Thank you."}
+        return
+
+    subject = req_body['subject']['name']
+    question_pdf, answer_pdf = await arender_paper(master_json, subject)
+    question_url, answer_url = await upload_paper(question_pdf, answer_pdf, subject)
+
+    yield {"event": "paper", "question_url": question_url, "answer_url": answer_url}
+
+    if req_body.get("variants"):
+        sections = [{"questions": questions} for questions in master_json]
+        yield {"event": "variants", **await requested_variants(sections, subject, req_body["variants"])}
+
+
+async def upload_paper(question_pdf, answer_pdf, subject):
+    """Upload both PDFs (as bytes) and return their signed URLs."""
 
     unique_id = os.urandom(6).hex()
 
@@ -79,32 +267,26 @@ def get_bot_reponse(req_body):
     bucket_name = "qgenie-question-papers"
     # ----------------------------------------
 
-    # Call the updated function to get signed URLs
-    question_url = upload_and_get_signed_url(project_id, bucket_name, question_paper_path, QUESTION_DESTINATION_BLOB_NAME)
-    answer_url = upload_and_get_signed_url(project_id, bucket_name, answer_sheet_path, ANSWER_DESTINATION_BLOB_NAME)
+    # Call the updated function to get signed URLs (both uploads run in parallel on the worker pool)
+    question_url, answer_url = await asyncio.gather(
+        worker_pool.run(upload_and_get_signed_url, project_id, bucket_name, question_pdf, QUESTION_DESTINATION_BLOB_NAME),
+        worker_pool.run(upload_and_get_signed_url, project_id, bucket_name, answer_pdf, ANSWER_DESTINATION_BLOB_NAME),
+    )
 
-
-    # Return the signed URLs
-    return {
-        "bot": {
-            "text": f"Please find the files generated here \n\nQuestion Paper: {question_paper_path} \n\nAnswer Sheet: {answer_sheet_path}",
-            "items": []
-        },
-        "type": "default"
-    }
+    return question_url, answer_url
 
 
 import datetime
 from google.cloud import storage
 
-def upload_and_get_signed_url(project_id, bucket_name, source_file_path, destination_blob_name):
+def upload_and_get_signed_url(project_id, bucket_name, data, destination_blob_name):
     """
-    Uploads a file to GCS and returns a time-limited signed URL for access.
+    Uploads a PDF to GCS and returns a time-limited signed URL for access.
     
     Args:
         project_id (str): Your Google Cloud project ID.
         bucket_name (str): Name of the GCS bucket.
-        source_file_path (str): Local path to the file.
+        data (bytes): The PDF contents, rendered in memory.
         destination_blob_name (str): Name for the file in the bucket.
     
     Returns:
@@ -115,9 +297,11 @@ def upload_and_get_signed_url(project_id, bucket_name, source_file_path, destina
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(destination_blob_name)
         
-        # Upload the file
-        blob.upload_from_filename(source_file_path)
-        print(f"File {source_file_path} uploaded to {destination_blob_name}.")
+        # Upload straight from memory
+        if data is None:
+            raise ValueError("No PDF to upload")
+        blob.upload_from_string(data, content_type="application/pdf")
+        print(f"File uploaded to {destination_blob_name}.")
 
         # Generate a signed URL, valid for 1 hour (you can change this)
         expiration_time = datetime.timedelta(hours=1)
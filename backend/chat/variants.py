@@ -0,0 +1,140 @@
+import json
+import math
+import random
+import re
+
+
+# Sets are labelled A, B, C, ...; more than this many rarely helps in one exam hall
+MAX_VARIANTS = 8
+
+# Reshuffles of a set that came out the same as an earlier one before giving up
+MAX_RESHUFFLES = 20
+
+
+class NotEnoughVariants(Exception):
+    """Raised when a paper cannot be shuffled into as many different sets as asked for."""
+
+
+# Option references in MCQ reasons: "(b)", "b) two", "option b", and "answer is b" or
+# "Answer: b" where the letter ends the phrase (so "the answer is a prime" is left alone)
+_OPTION_REFERENCE = re.compile(
+    r'(?<!\w)\((?P<paren>[a-z])\)'
+    r'|(?<!\S)(?P<close>[a-z])\)'
+    r'|\b(?P<word>[Oo]ption )(?P<key>[a-z])\b'
+    r'|\b(?P<answer>[Aa]nswer is |[Aa]nswer: ?)(?P<answer_key>[a-z])\b(?!\s*[a-z0-9])'
+)
+
+
+def variant_label(index):
+    return chr(ord("A") + index)
+
+
+def _remap_reason(reason, mapping):
+    def replace(match):
+        if match.group("paren"):
+            return f"({mapping.get(match.group('paren'), match.group('paren'))})"
+        if match.group("close"):
+            # "b)" closing a bracket, as in "(a + b)", is not an option
+            before = reason[:match.start()]
+            if before.count("(") > before.count(")"):
+                return match.group(0)
+            return f"{mapping.get(match.group('close'), match.group('close'))})"
+        if match.group("answer"):
+            return f"{match.group('answer')}{mapping.get(match.group('answer_key'), match.group('answer_key'))}"
+        return f"{match.group('word')}{mapping.get(match.group('key'), match.group('key'))}"
+
+    return _OPTION_REFERENCE.sub(replace, reason)
+
+
+def shuffle_options(question, rng):
+    """
+    The question with its MCQ options in a new order under the same keys;
+    the answer and option references in the reason follow their option.
+    Questions without options are returned as they are.
+    """
+    options = question.get("options")
+    if not isinstance(options, dict) or len(options) < 2:
+        return question
+
+    keys = sorted(options)
+    order = keys[:]
+    rng.shuffle(order)
+    # Option ``order[i]`` of the original is shown under ``keys[i]``
+    mapping = {old: new for new, old in zip(keys, order)}
+
+    shuffled = dict(question)
+    shuffled["options"] = {new: options[old] for new, old in zip(keys, order)}
+    if question.get("answer") in mapping:
+        shuffled["answer"] = mapping[question["answer"]]
+    if question.get("reason"):
+        shuffled["reason"] = _remap_reason(question["reason"], mapping)
+    return shuffled
+
+
+def make_variant(sections, seed):
+    """
+    One shuffled version of a paper: the questions of every section in a
+    new order (sections keep theirs) and every MCQ's options reordered.
+    The same ``seed`` always gives the same paper.
+
+    Args:
+        sections (list[list[dict]]): Questions per section.
+        seed (str): Seed of this version, e.g. "<job id>:B".
+
+    Returns:
+        list[list[dict]]: The shuffled sections; the input is not modified.
+    """
+    rng = random.Random(seed)
+    variant = []
+    for section in sections:
+        questions = [shuffle_options(question, rng) for question in section]
+        rng.shuffle(questions)
+        variant.append(questions)
+    return variant
+
+
+def variant_capacity(sections):
+    """Number of different orders of the questions and MCQ options of a paper."""
+    capacity = 1
+    for section in sections:
+        capacity *= math.factorial(len(section))
+        for question in section:
+            options = question.get("options")
+            if isinstance(options, dict):
+                capacity *= math.factorial(len(options))
+    return capacity
+
+
+def make_variants(sections, count, seed):
+    """
+    Args:
+        sections (list[list[dict]]): Questions per section.
+        count (int): Number of versions, at most ``MAX_VARIANTS``.
+        seed (str): Base seed; version X is shuffled with "<seed>:X", and
+            with "<seed>:X:<n>" if that gave a copy of an earlier version.
+
+    Returns:
+        list[tuple[str, list[list[dict]]]]: ``(label, sections)`` per version, all different.
+
+    Raises:
+        NotEnoughVariants: The paper has too few questions and options to
+            give ``count`` different versions.
+    """
+    count = max(1, min(int(count), MAX_VARIANTS))
+    if variant_capacity(sections) < count:
+        raise NotEnoughVariants(f"The paper can only be shuffled into {variant_capacity(sections)} different set(s)")
+
+    variants = []
+    seen = set()
+    for index in range(count):
+        label = variant_label(index)
+        for attempt in range(MAX_RESHUFFLES + 1):
+            variant = make_variant(sections, f"{seed}:{label}" if attempt == 0 else f"{seed}:{label}:{attempt}")
+            key = json.dumps(variant, sort_keys=True, ensure_ascii=False, default=str)
+            if key not in seen:
+                break
+        else:
+            raise NotEnoughVariants(f"Could not shuffle the paper into {count} different sets")
+        seen.add(key)
+        variants.append((label, variant))
+    return variants
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from .text_processing import tokenize
+
+
+# Embedding matrices are persisted here so new workers can memory-map them
+VECTOR_CACHE_DIR = os.getenv("QGENIE_VECTOR_CACHE_DIR", "assets/vector_cache")
+
+
+class HashingEmbedder:
+    """
+    Offline default embedder: signed feature hashing of unigrams and bigrams,
+    with sublinear term frequency and L2 normalization.
+
+    Any object with a ``name`` attribute and an ``embed(texts) -> ndarray``
+    method returning one row per text can be used instead.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], (hashes % self.dim).astype(np.intp), signs)
+        np.copyto(matrix, np.sign(matrix) * np.log1p(np.abs(matrix)))
+        return _normalize(matrix)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def fingerprint(texts, embedder):
+    """Content hash identifying an embedding matrix for ``texts``."""
+    digest = hashlib.sha256(embedder.name.encode("utf-8"))
+    for text in texts:
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class VectorIndex:
+    """Dense cosine-similarity index over a row-normalized embedding matrix."""
+
+    def __init__(self, matrix, embedder):
+        self.matrix = matrix
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, texts, embedder):
+        return cls(embedder.embed(texts), embedder)
+
+    @classmethod
+    def load_or_build(cls, texts, embedder, name, cache_dir=VECTOR_CACHE_DIR):
+        """
+        Memory-map a persisted matrix for ``texts`` or build and persist it.
+
+        Args:
+            texts (list[str]): Documents, one row each.
+            embedder: Embedder used for documents and queries.
+            name (str): Human readable prefix for the cache file.
+            cache_dir (str): Directory for the ``.npy`` files, or None to skip persistence.
+
+        Returns:
+            VectorIndex: The index.
+        """
+        if not cache_dir:
+            return cls.build(texts, embedder)
+
+        path = os.path.join(cache_dir, f"{name}-{fingerprint(texts, embedder)}.npy")
+        if os.path.exists(path):
+            try:
+                matrix = np.load(path, mmap_mode="r")
+                if matrix.shape[0] == len(texts):
+                    return cls(matrix, embedder)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable vector cache {path}: {e}")
+
+        index = cls.build(texts, embedder)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write then rename so concurrently starting workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, index.matrix)
+            os.replace(tmp_path, path)
+            with open(os.path.join(cache_dir, f"{name}.json"), "w") as file:
+                json.dump({"embedder": embedder.name, "rows": len(texts), "file": os.path.basename(path)}, file)
+        except OSError as e:
+            print(f"Could not persist vector cache {path}: {e}")
+        return index
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, queries, k=10, candidates=None):
+        """
+        Batched cosine top-k.
+
+        Args:
+            queries (list[str]): Query texts, embedded in one call.
+            k (int): Results per query.
+            candidates (list[int]): Optional row ids to restrict the search to.
+
+        Returns:
+            list[list[tuple[int, float]]]: Per query, (row id, score) best first.
+        """
+        if not queries or len(self) == 0:
+            return [[] for _ in queries]
+
+        rows = np.arange(len(self)) if candidates is None else np.asarray(list(candidates), dtype=np.intp)
+        if rows.size == 0:
+            return [[] for _ in queries]
+
+        scores = self.embedder.embed(queries) @ np.asarray(self.matrix[rows]).T
+        k = min(k, rows.size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, query_top in zip(scores, top):
+            order = query_top[np.argsort(-query_scores[query_top], kind="stable")]
+            results.append([(int(rows[i]), float(query_scores[i])) for i in order])
+        return results
@@ -0,0 +1,392 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import NamedTuple
+
+from .token_budget import estimate_tokens
+
+
+class ModelQuota(NamedTuple):
+    requests_per_minute: int
+    tokens_per_minute: int  # estimated prompt + response tokens
+
+
+MODEL_QUOTAS = {
+    "gemini-2.5-pro": ModelQuota(
+        requests_per_minute=int(os.getenv("VERTEX_PRO_RPM", "60")),
+        tokens_per_minute=int(os.getenv("VERTEX_PRO_TPM", "1000000")),
+    ),
+    "gemini-2.5-flash": ModelQuota(
+        requests_per_minute=int(os.getenv("VERTEX_FLASH_RPM", "300")),
+        tokens_per_minute=int(os.getenv("VERTEX_FLASH_TPM", "2000000")),
+    ),
+}
+DEFAULT_QUOTA = ModelQuota(requests_per_minute=60, tokens_per_minute=500_000)
+
+# Assumed response size when reserving tokens; corrected from usage_metadata afterwards
+EXPECTED_OUTPUT_TOKENS = 4_000
+
+# HTTP statuses worth retrying: quota exhaustion and transient server errors
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+MAX_ATTEMPTS = int(os.getenv("VERTEX_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Vertex while the model's circuit breaker is open."""
+
+
+def is_retryable(error):
+    """Quota, server and connection errors are retried; anything else is the caller's problem."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in ("ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError")
+
+
+def backoff_seconds(attempt):
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at ``per_minute``.
+
+    ``reserve`` always succeeds and returns how long the caller has to wait
+    for its share, so concurrent callers queue up in arrival order instead
+    of polling.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate) if self.rate else 0.0
+
+    def adjust(self, amount):
+        """Give back (positive) or take (negative) tokens once the real cost is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_seconds``; then lets one trial call through (half-open) and
+    closes again if it succeeds.
+
+    A trial that ends without an outcome (cancelled, or a stream that is
+    never read) is given up by ``release``, or after ``trial_seconds`` at
+    the latest, so the breaker cannot stay half-open forever.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, trial_seconds=120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.trial_seconds = trial_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            if self._trial_started is not None and now - self._trial_started < self.trial_seconds:
+                return False
+            self._trial_started = now
+            return True
+
+    def release(self):
+        """Give up the trial of a call that neither succeeded nor failed."""
+        with self._lock:
+            self._trial_started = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_started = None
+
+
+class _ModelGovernor:
+    def __init__(self, quota, failure_threshold, reset_seconds):
+        self.quota = quota
+        self.requests = TokenBucket(quota.requests_per_minute)
+        self.tokens = TokenBucket(quota.tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.metrics = {
+            "calls": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "rejected": 0,
+            "throttled_seconds": 0.0,
+            "tokens": 0,
+        }
+
+
+class RateGovernor:
+    """
+    Per-model request and token buckets, retries and circuit breakers shared
+    by every Vertex call of the process.
+    """
+
+    def __init__(self, quotas=None, default_quota=DEFAULT_QUOTA, max_attempts=MAX_ATTEMPTS, failure_threshold=5, reset_seconds=30.0):
+        self.quotas = quotas if quotas is not None else MODEL_QUOTAS
+        self.default_quota = default_quota
+        self.max_attempts = max_attempts
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, model):
+        with self._lock:
+            governor = self._models.get(model)
+            if governor is None:
+                quota = self.quotas.get(model, self.default_quota)
+                governor = self._models[model] = _ModelGovernor(quota, self.failure_threshold, self.reset_seconds)
+            return governor
+
+    def _count(self, governor, key, amount=1):
+        with self._lock:
+            governor.metrics[key] += amount
+
+    def admit(self, model, contents):
+        """
+        Check the breaker and reserve quota for one call.
+
+        Returns:
+            tuple[float, int]: Seconds to wait before calling, and the reserved token estimate.
+        """
+        governor = self.model(model)
+        if not governor.breaker.allow():
+            self._count(governor, "rejected")
+            raise CircuitOpenError(f"{model} is failing, not calling Vertex for up to {self.reset_seconds:.0f}s")
+        reserved = estimate_tokens(contents if isinstance(contents, str) else str(contents)) + EXPECTED_OUTPUT_TOKENS
+        wait = max(governor.requests.reserve(1), governor.tokens.reserve(reserved))
+        self._count(governor, "calls")
+        if wait:
+            self._count(governor, "throttled_seconds", wait)
+        return wait, reserved
+
+    def succeeded(self, model, reserved, response=None):
+        governor = self.model(model)
+        governor.breaker.record_success()
+        self._count(governor, "succeeded")
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None)
+        if isinstance(actual, int):
+            governor.tokens.adjust(reserved - actual)
+        else:
+            actual = reserved
+        self._count(governor, "tokens", actual)
+
+    def failed(self, model, error):
+        """Record a failed attempt; returns True if it should be retried."""
+        governor = self.model(model)
+        retryable = is_retryable(error)
+        if retryable:
+            governor.breaker.record_failure()
+        else:
+            # Vertex answered; the request itself was bad
+            governor.breaker.record_success()
+        self._count(governor, "failed")
+        return retryable
+
+    def retrying(self, model):
+        self._count(self.model(model), "retries")
+
+    def abandoned(self, model):
+        """Record a call that was cancelled before it had an outcome."""
+        self.model(model).breaker.release()
+
+    def stats(self):
+        with self._lock:
+            models = dict(self._models)
+        return {
+            model: {
+                **{key: round(value, 3) if isinstance(value, float) else value for key, value in governor.metrics.items()},
+                "circuit": governor.breaker.state,
+                "requests_per_minute": governor.quota.requests_per_minute,
+                "tokens_per_minute": governor.quota.tokens_per_minute,
+                "available_requests": round(governor.requests.available, 2),
+                "available_tokens": int(governor.tokens.available),
+            }
+            for model, governor in models.items()
+        }
+
+
+class _Models:
+    def __init__(self, models, governor):
+        self._models = models
+        self._governor = governor
+
+    def generate_content(self, *, model, contents, **kwargs):
+        for attempt in range(self._governor.max_attempts):
+            wait, reserved = self._governor.admit(model, contents)
+            if wait:
+                time.sleep(wait)
+            try:
+                response = self._models.generate_content(model=model, contents=contents, **kwargs)
+            except Exception as e:
+                if not self._governor.failed(model, e) or attempt + 1 >= self._governor.max_attempts:
+                    raise
+                self._governor.retrying(model)
+                time.sleep(backoff_seconds(attempt))
+            except BaseException:
+                self._governor.abandoned(model)
+                raise
+            else:
+                self._governor.succeeded(model, reserved, response)
+                return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _AsyncModels:
+    def __init__(self, models, governor):
+        self._models = models
+        self._governor = governor
+
+    async def generate_content(self, *, model, contents, **kwargs):
+        for attempt in range(self._governor.max_attempts):
+            wait, reserved = self._governor.admit(model, contents)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await self._models.generate_content(model=model, contents=contents, **kwargs)
+            except Exception as e:
+                if not self._governor.failed(model, e) or attempt + 1 >= self._governor.max_attempts:
+                    raise
+                self._governor.retrying(model)
+                await asyncio.sleep(backoff_seconds(attempt))
+            except BaseException:
+                # Cancelled, e.g. the client of a stream went away
+                self._governor.abandoned(model)
+                raise
+            else:
+                self._governor.succeeded(model, reserved, response)
+                return response
+
+    async def generate_content_stream(self, *, model, contents, **kwargs):
+        """
+        Streams are only retried while opening; once chunks have been
+        delivered a failure is passed on to the caller.
+        """
+        for attempt in range(self._governor.max_attempts):
+            wait, reserved = self._governor.admit(model, contents)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                stream = await self._models.generate_content_stream(model=model, contents=contents, **kwargs)
+            except Exception as e:
+                if not self._governor.failed(model, e) or attempt + 1 >= self._governor.max_attempts:
+                    raise
+                self._governor.retrying(model)
+                await asyncio.sleep(backoff_seconds(attempt))
+            except BaseException:
+                self._governor.abandoned(model)
+                raise
+            else:
+                return self._watch(model, reserved, stream)
+
+    async def _watch(self, model, reserved, stream):
+        last = None
+        try:
+            async for chunk in stream:
+                last = chunk
+                yield chunk
+        except Exception as e:
+            self._governor.failed(model, e)
+            raise
+        except BaseException:
+            # Closed or cancelled before the end: no verdict on the model
+            if last is None:
+                self._governor.abandoned(model)
+            else:
+                self._governor.succeeded(model, reserved, last)
+            raise
+        else:
+            # The final chunk carries the usage of the whole response
+            self._governor.succeeded(model, reserved, last)
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _Aio:
+    def __init__(self, aio, governor):
+        self._aio = aio
+        self.models = _AsyncModels(aio.models, governor)
+
+    def __getattr__(self, name):
+        return getattr(self._aio, name)
+
+
+class GovernedClient:
+    """
+    Drop-in wrapper around a ``genai.Client``: ``models.generate_content``,
+    ``aio.models.generate_content`` and ``aio.models.generate_content_stream``
+    go through the rate governor; everything else is passed through.
+    """
+
+    def __init__(self, client, governor):
+        self._client = client
+        self.governor = governor
+        self.models = _Models(client.models, governor)
+        self.aio = _Aio(client.aio, governor)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+vertex_governor = RateGovernor(
+    failure_threshold=int(os.getenv("VERTEX_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("VERTEX_BREAKER_RESET_SECONDS", "30")),
+)
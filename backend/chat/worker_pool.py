@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPoolSaturated(Exception):
+    """Raised when the pool already holds as many tasks as it accepts."""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for the blocking parts of the chat pipeline
+    (synchronous Gemini calls, PDF rendering, GCS uploads), so they never run
+    on the event loop.
+
+    At most ``max_workers`` tasks run at once and at most ``max_queue`` wait
+    behind them; further submissions are rejected with ``WorkerPoolSaturated``
+    instead of piling up unbounded.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qgenie-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _dequeue(self, ticket):
+        # Called with the lock held; whichever of the worker and the caller
+        # gets here first takes the task off the queue count
+        if not ticket[0]:
+            ticket[0] = True
+            self._queued -= 1
+
+    def _execute(self, fn, submitted_at, ticket):
+        started = time.perf_counter()
+        with self._lock:
+            self._dequeue(ticket)
+            self._running += 1
+            self._max_wait_seconds = max(self._max_wait_seconds, started - submitted_at)
+        try:
+            result = fn()
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._busy_seconds += time.perf_counter() - started
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise WorkerPoolSaturated(f"{self._queued} tasks already waiting for a worker")
+            self._queued += 1
+
+        # Set once the task has left the queue, so a task that never starts
+        # (rejected by a shut down executor, cancelled) is not counted forever
+        ticket = [False]
+        loop = asyncio.get_running_loop()
+        task = functools.partial(self._execute, functools.partial(fn, *args, **kwargs), time.perf_counter(), ticket)
+        try:
+            return await loop.run_in_executor(self._executor, task)
+        finally:
+            with self._lock:
+                self._dequeue(ticket)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "busy_seconds": round(self._busy_seconds, 3),
+                "max_wait_seconds": round(self._max_wait_seconds, 3),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+worker_pool = WorkerPool(
+    max_workers=int(os.getenv("WORKER_POOL_SIZE", "8")),
+    max_queue=int(os.getenv("WORKER_QUEUE_LIMIT", "32")),
+)
@@ -1,6 +1,6 @@
 from .database import Base, get_db_session, engine
 from .config import settings
-from .models import Institution, Educator, KnowledgeBase, QuestionPaper, AnswerSheet
+from .models import Institution, Educator, KnowledgeBase, QuestionPaper, AnswerSheet, GenerationJob, BankQuestion, BankQuestionUse
 
 __all__ = [
     'Base', 
@@ -11,5 +11,8 @@ __all__ = [
     'Educator',
     'KnowledgeBase',
     'QuestionPaper',
-    'AnswerSheet'
+    'AnswerSheet',
+    'GenerationJob',
+    'BankQuestion',
+    'BankQuestionUse'
 ] 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, JSON, ForeignKey, ARRAY, UUID, Table, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, JSON, ForeignKey, ARRAY, UUID, Table, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -153,4 +153,51 @@ class Topic(Base):
 
     __table_args__ = (
         UniqueConstraint('subject_id', 'topic', name='unique_subject_topic'),
-    ) 
\ No newline at end of file
+    )
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True)
+    educator_id = Column(UUID, ForeignKey("educators.id"), nullable=False)
+    status = Column(String, nullable=False, index=True)  # queued, running, succeeded or failed
+    stage = Column(String)  # retrieve, generate, render or upload
+    progress = Column(JSON)
+    request = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(String)
+    owner = Column(String)  # Worker process running the job; updated_at is its lease heartbeat
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class BankQuestion(Base):
+    __tablename__ = "question_bank"
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    curriculum = Column(String, nullable=False)
+    standard = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    topic = Column(String, nullable=False)
+    type = Column(String, nullable=False)  # mcq or subjective
+    difficulty = Column(String, nullable=False)  # easy, medium or hard
+    marks = Column(Integer, nullable=False)
+    question = Column(JSON, nullable=False)  # the question as generated, incl. options and answer
+    source = Column(JSON)  # chapter names & page numbers cited by the model
+    content_hash = Column(String, nullable=False, unique=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_question_bank_lookup', 'curriculum', 'standard', 'subject', 'topic', 'type', 'difficulty', 'marks'),
+    )
+
+class BankQuestionUse(Base):
+    __tablename__ = "question_bank_usage"
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    question_id = Column(UUID, ForeignKey("question_bank.id"), nullable=False)
+    educator_id = Column(UUID, ForeignKey("educators.id"), nullable=False, index=True)
+    used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('question_id', 'educator_id', name='unique_question_educator'),
+    )
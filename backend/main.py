@@ -3,8 +3,23 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from db import Base, engine, get_db_session
+from db.database import get_db
+from db.models import Standard, Subject, Topic
+from auth.jwt_utils import get_current_user
 from auth.routes import router as auth_router
 from chat.routes import router as chat_router
+from chat.context_cache import context_cache
+from chat.jobs import job_manager
+from chat.knowledge_base import knowledge_base
+from chat.model_router import model_router
+from chat.query_cache import class_subject_cache, exam_specifications_cache
+from chat.question_bank import question_bank
+from chat.render_service import render_service
+from chat.topic_matcher import topic_matcher
+from chat import intent_parser
+from chat.utils import generate_paper
+from chat.vertex_client import vertex_governor
+from chat.worker_pool import worker_pool
 from paper_props.routes import router as paper_props_router
 
 app = FastAPI(
@@ -25,10 +40,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def topic_extractions():
+    """Chapter extractions of uploaded knowledge bases, for the in-memory knowledge base."""
+    with get_db() as db:
+        return db.query(Standard.standard, Subject.subject, Topic.topic, Topic.extraction)\
+            .join(Subject, Subject.standard_id == Standard.id)\
+            .join(Topic, Topic.subject_id == Subject.id)\
+            .filter(Topic.extraction.isnot(None))\
+            .all()
+
+def reload_knowledge_base():
+    """Reload the knowledge base (with the extraction loader given at startup) and its topic index."""
+    stats = knowledge_base.reload()
+    topic_matcher.reload()
+    return stats
+
 @app.on_event("startup")
 async def startup():
+    # Fork the PDF render processes before any other threads are started
+    render_service.start()
     # Create database tables
     Base.metadata.create_all(bind=engine)
+    # Parse the knowledge base once per process instead of on every paper
+    knowledge_base.load(topic_extractions)
+    topic_matcher.reload()
+    # Background workers for queued paper generation jobs
+    await job_manager.start(runner=generate_paper)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    # Cached chapter contents are billed per hour while they exist
+    await context_cache.clear()
+    worker_pool.shutdown()
+    render_service.shutdown()
 
 # Create API router with prefix
 api_router = APIRouter(prefix="/api")
@@ -38,6 +83,37 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@api_router.get("/health/kb")
+async def knowledge_base_stats():
+    """Knowledge base index size and load stats"""
+    return knowledge_base.stats()
+
+@api_router.post("/health/kb/reload")
+async def knowledge_base_reload(current_user: dict = Depends(get_current_user)):
+    """Re-read the knowledge base CSV and chapter extractions in this process and rebuild the topic index"""
+    return await worker_pool.run(reload_knowledge_base)
+
+@api_router.get("/health/workers")
+async def worker_pool_stats():
+    """Queue depth and throughput of the blocking-work pool, the job queue and the render processes"""
+    return {**worker_pool.stats(), "jobs": job_manager.stats(), "render": render_service.stats()}
+
+@api_router.get("/health/cache")
+async def query_cache_stats():
+    """Hit and miss counters of the chat caches and the local intent parser"""
+    return {
+        "class_subject": class_subject_cache.stats(),
+        "exam_specifications": exam_specifications_cache.stats(),
+        "local_parser": intent_parser.stats(),
+        "context_cache": context_cache.stats(),
+        "question_bank": question_bank.stats(),
+    }
+
+@api_router.get("/health/vertex")
+async def vertex_stats():
+    """Per-model quota usage, retries, circuit breaker state and routing stats of Vertex calls"""
+    return {"governor": vertex_governor.stats(), "routing": model_router.stats()}
+
 @api_router.get("/health/ready")
 async def test_db(db: Session = Depends(get_db_session)):
     """Test endpoint to verify database connection"""
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+from chat.vertex_client import CircuitBreaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("chat.vertex_client.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, trial_seconds=120)
+
+    def open(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+
+    def test_one_trial_after_the_reset_time(self):
+        self.open()
+        self.now += 30
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_trial_closes(self):
+        self.open()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        self.open()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+
+    def test_released_trial_lets_the_next_call_try(self):
+        self.open()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+
+    def test_abandoned_trial_expires(self):
+        self.open()
+        self.now += 30
+        self.breaker.allow()
+        self.now += 119
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+
+from chat.context_cache import ContextCacheManager, LocalContextCacheBackend
+
+
+def markdown(label, tokens=100):
+    return f"Chapter : {label}\n" + "x" * (tokens * 4)
+
+
+class FailingBackend(LocalContextCacheBackend):
+    async def create(self, model, contents, ttl_seconds, display_name):
+        raise RuntimeError("quota exceeded")
+
+
+class ContextCacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalContextCacheBackend()
+        self.cache = ContextCacheManager(self.backend, ttl_seconds=3600, min_tokens=50, max_tokens=1000, max_entries=2, refresh_margin=60)
+
+    def test_creates_once_and_reuses(self):
+        async def run():
+            first = await self.cache.get("flash", markdown("one"))
+            second = await self.cache.get("flash", markdown("one"))
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(self.backend.contents[first], markdown("one"))
+        self.assertEqual(self.backend.created, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_concurrent_gets_share_one_create(self):
+        async def run():
+            return await asyncio.gather(*(self.cache.get("flash", markdown("one")) for _ in range(5)))
+
+        names = asyncio.run(run())
+        self.assertEqual(len(set(names)), 1)
+        self.assertEqual(self.backend.created, 1)
+
+    def test_entries_are_per_model(self):
+        async def run():
+            return await self.cache.get("flash", markdown("one")), await self.cache.get("pro", markdown("one"))
+
+        flash, pro = asyncio.run(run())
+        self.assertNotEqual(flash, pro)
+
+    def test_text_outside_the_token_limits_is_not_cached(self):
+        async def run():
+            return await self.cache.get("flash", markdown("short", 10)), await self.cache.get("flash", markdown("long", 2000))
+
+        self.assertEqual(asyncio.run(run()), (None, None))
+        self.assertEqual(self.backend.created, 0)
+
+    def test_no_backend_disables_caching(self):
+        cache = ContextCacheManager(None, min_tokens=50)
+        self.assertIsNone(asyncio.run(cache.get("flash", markdown("one"))))
+        self.assertFalse(cache.stats()["enabled"])
+
+    def test_least_recently_used_entry_is_deleted_remotely(self):
+        async def run():
+            first = await self.cache.get("flash", markdown("one"))
+            await self.cache.get("flash", markdown("two"))
+            await self.cache.get("flash", markdown("one"))
+            await self.cache.get("flash", markdown("three"))
+            return first
+
+        first = asyncio.run(run())
+        self.assertIn(first, self.backend.contents)
+        self.assertEqual(self.backend.deleted, 1)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_entries_close_to_expiry_are_created_again(self):
+        cache = ContextCacheManager(self.backend, ttl_seconds=30, min_tokens=50, refresh_margin=60)
+
+        async def run():
+            return await cache.get("flash", markdown("one")), await cache.get("flash", markdown("one"))
+
+        first, second = asyncio.run(run())
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.backend.created, 2)
+
+    def test_invalidate_forgets_and_deletes(self):
+        async def run():
+            name = await self.cache.get("flash", markdown("one"))
+            await self.cache.invalidate(name)
+            return name, await self.cache.get("flash", markdown("one"))
+
+        name, again = asyncio.run(run())
+        self.assertNotEqual(name, again)
+        self.assertNotIn(name, self.backend.contents)
+        self.assertEqual(self.backend.deleted, 1)
+
+    def test_clear_deletes_everything(self):
+        async def run():
+            await self.cache.get("flash", markdown("one"))
+            await self.cache.get("flash", markdown("two"))
+            await self.cache.clear()
+
+        asyncio.run(run())
+        self.assertEqual(self.backend.contents, {})
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_failed_create_falls_back_to_inline(self):
+        cache = ContextCacheManager(FailingBackend(), min_tokens=50)
+        self.assertIsNone(asyncio.run(cache.get("flash", markdown("one"))))
+        self.assertEqual(cache.stats()["failures"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
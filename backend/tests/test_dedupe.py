@@ -0,0 +1,47 @@
+import unittest
+
+from chat.dedupe import LSHIndex, dedupe_paper, dedupe_questions
+
+
+def question(text, **options):
+    return {"question": f"{text} [Marks 1]", "options": options} if options else {"question": f"{text} [Marks 1]"}
+
+
+PHOTOSYNTHESIS = question("Which gas do green plants release into the atmosphere during photosynthesis when leaves absorb carbon dioxide in sunlight?")
+PHOTOSYNTHESIS_AGAIN = question("Which gas do green plants release into the atmosphere during photosynthesis, when leaves absorb carbon dioxide in daylight?")
+EUCLID = question("State Euclid's division lemma and use it to find the HCF of 135 and 225")
+PRIMES = question("Prove that the square root of two is an irrational number using contradiction")
+
+
+class DedupeTest(unittest.TestCase):
+
+    def test_near_duplicates_are_dropped(self):
+        self.assertEqual(dedupe_questions([PHOTOSYNTHESIS, EUCLID, PHOTOSYNTHESIS_AGAIN, PRIMES]), [PHOTOSYNTHESIS, EUCLID, PRIMES])
+
+    def test_existing_questions_are_not_repeated(self):
+        self.assertEqual(dedupe_questions([PHOTOSYNTHESIS_AGAIN, EUCLID], existing=[PHOTOSYNTHESIS]), [EUCLID])
+
+    def test_options_are_part_of_the_question(self):
+        first = question("Which of these is a prime number", a="4", b="6", c="7", d="9")
+        second = question("Which of these is a prime number", a="12", b="15", c="21", d="23")
+        self.assertEqual(dedupe_questions([first, second], threshold=0.9), [first, second])
+
+    def test_invalid_and_wordless_questions(self):
+        self.assertEqual(dedupe_questions([{"answer": "a"}, "text", question("?"), question("?")]), [question("?"), question("?")])
+
+    def test_paper_keeps_first_occurrence_in_section_order(self):
+        self.assertEqual(
+            dedupe_paper([[PHOTOSYNTHESIS, EUCLID], [PHOTOSYNTHESIS_AGAIN, PRIMES], [EUCLID]]),
+            [[PHOTOSYNTHESIS, EUCLID], [PRIMES], []],
+        )
+
+    def test_shared_index_across_batches(self):
+        index = LSHIndex()
+        self.assertEqual(dedupe_questions([PHOTOSYNTHESIS], index=index), [PHOTOSYNTHESIS])
+        self.assertEqual(dedupe_questions([PHOTOSYNTHESIS_AGAIN, EUCLID], index=index), [EUCLID])
+        self.assertEqual(len(index), 2)
+        self.assertIsNotNone(index.find(PHOTOSYNTHESIS_AGAIN))
+
+
+if __name__ == "__main__":
+    unittest.main()
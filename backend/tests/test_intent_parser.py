@@ -0,0 +1,58 @@
+import unittest
+
+from chat.intent_parser import parse_class_subject, parse_exam_specifications
+
+
+class ParseClassSubjectTest(unittest.TestCase):
+
+    def test_supported_combinations(self):
+        self.assertEqual(parse_class_subject("Class 10 maths paper"), {
+            "standard": {"id": "CLASS 10", "name": "CLASS 10"},
+            "subject": {"id": "MATHS", "name": "MATHS"},
+        })
+        self.assertEqual(parse_class_subject("I need a 12th physics test")["standard"]["name"], "CLASS 12")
+        self.assertEqual(parse_class_subject("class xii physics")["subject"]["name"], "PHYSICS")
+
+    def test_unsupported_subject_is_blank(self):
+        self.assertEqual(parse_class_subject("class 10 chemistry")["subject"]["name"], "")
+        self.assertEqual(parse_class_subject("class 9 maths")["standard"]["name"], "")
+
+    def test_unclear_queries_go_to_the_llm(self):
+        for query in ("class 10 or 12 maths", "class 10 maths and physics", "class 10.5 maths", "maths for my toppers"):
+            with self.subTest(query=query):
+                self.assertIsNone(parse_class_subject(query))
+
+
+class ParseExamSpecificationsTest(unittest.TestCase):
+
+    def test_single_spec(self):
+        self.assertEqual(parse_exam_specifications("3 medium subjective questions of 5 marks"), [
+            {"difficulty": "medium", "type": "Subjective", "questions": 3, "marks": 5},
+        ])
+
+    def test_several_specs(self):
+        self.assertEqual(parse_exam_specifications("2 easy mcqs of 1 mark and 3 hard long answer questions of 5 marks"), [
+            {"difficulty": "easy", "type": "MCQ", "questions": 2, "marks": 1},
+            {"difficulty": "hard", "type": "Subjective", "questions": 3, "marks": 5},
+        ])
+
+    def test_missing_type_and_marks_are_blank(self):
+        self.assertEqual(parse_exam_specifications("5 easy questions"), [
+            {"difficulty": "easy", "type": "", "questions": 5, "marks": 0},
+        ])
+
+    def test_unclear_queries_go_to_the_llm(self):
+        for query in (
+            "3 easy and 2 hard mcqs of 1 mark each",
+            "10 easy mcqs for 20 marks total",
+            "3 medium subjective questions of 2.5 marks",
+            "2.5 easy mcqs",
+            "3 mcqs",
+            "a few easy questions",
+        ):
+            with self.subTest(query=query):
+                self.assertIsNone(parse_exam_specifications(query))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import unittest
+
+from chat.stream_parser import IncrementalArrayParser, loads_lenient, parse_question_list
+
+
+QUESTIONS = [
+    {"question": "What is {x} in 2x = 4? [Marks 1]", "answer": "b"},
+    {"question": "Say \"hello\" [Marks 2]", "answer": "a"},
+    {"question": "Third [Marks 1]", "answer": "c"},
+]
+
+
+class IncrementalArrayParserTest(unittest.TestCase):
+
+    def test_objects_are_returned_as_soon_as_they_close(self):
+        text = json.dumps(QUESTIONS)
+        parser = IncrementalArrayParser()
+        first_end = text.index('"b"}') + 4
+        self.assertEqual(parser.feed(text[:first_end - 1]), [])
+        self.assertEqual(parser.feed(text[first_end - 1:first_end]), QUESTIONS[:1])
+        self.assertEqual(parser.feed(text[first_end:]), QUESTIONS[1:])
+        self.assertEqual(parser.count, 3)
+
+    def test_character_by_character(self):
+        parser = IncrementalArrayParser()
+        items = []
+        for char in "```json\n" + json.dumps(QUESTIONS, indent=2) + "\n```":
+            items.extend(parser.feed(char))
+        self.assertEqual(items, QUESTIONS)
+        self.assertEqual(parser.pending, "")
+
+    def test_bare_object_is_one_item(self):
+        self.assertEqual(IncrementalArrayParser().feed(json.dumps(QUESTIONS[0])), QUESTIONS[:1])
+
+    def test_broken_object_is_repaired_or_reported(self):
+        parser = IncrementalArrayParser()
+        items = parser.feed('[{"question": "a", "answer": "b",}, {"question": oops}, {"question": "c"}]')
+        self.assertEqual(items, [{"question": "a", "answer": "b"}, {"question": "c"}])
+        self.assertEqual(parser.repaired, 1)
+        self.assertEqual(len(parser.errors), 1)
+
+    def test_unfinished_object_is_pending(self):
+        parser = IncrementalArrayParser()
+        parser.feed('[{"question": "a"}, {"question": "b')
+        self.assertEqual(parser.pending, '{"question": "b')
+
+
+class ParseQuestionListTest(unittest.TestCase):
+
+    def test_well_formed_output(self):
+        self.assertEqual(parse_question_list(json.dumps(QUESTIONS)), (QUESTIONS, 0, 0, False))
+
+    def test_wrapped_in_an_object(self):
+        self.assertEqual(parse_question_list(json.dumps({"questions": QUESTIONS})).questions, QUESTIONS)
+
+    def test_truncated_output_keeps_complete_questions(self):
+        text = json.dumps(QUESTIONS)
+        parsed = parse_question_list(text[:text.rindex("{") + 10])
+        self.assertEqual(parsed.questions, QUESTIONS[:2])
+        self.assertTrue(parsed.truncated)
+
+    def test_loads_lenient(self):
+        self.assertEqual(loads_lenient('```json\n[{"a": "line\nbreak",},]\n```'), [{"a": "line\nbreak"}])
+        with self.assertRaises(ValueError):
+            loads_lenient("not json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from google import genai
+from google.auth.credentials import AnonymousCredentials
+from google.genai import models
+
+from chat.prompt_processor import generation_config, structured_config
+from chat.schemas import ClassSubject, ExamSpecification
+
+
+# google-genai has no public way to build the Vertex request without sending it
+@unittest.skipUnless(hasattr(models, "_GenerateContentConfig_to_vertex"), "google-genai no longer exposes its Vertex converter")
+class StructuredConfigTest(unittest.TestCase):
+    """The response schemas we send must survive google-genai's Vertex conversion."""
+
+    def setUp(self):
+        self.client = genai.Client(vertexai=True, project="test", location="us-central1", credentials=AnonymousCredentials())
+
+    def to_vertex(self, config):
+        return models._GenerateContentConfig_to_vertex(self.client._api_client, config, {})
+
+    def test_question_lists(self):
+        for question_type in ("MCQ", "Subjective"):
+            with self.subTest(question_type=question_type):
+                config = self.to_vertex(generation_config({"type": question_type, "questions": 2, "marks": 1}))
+                self.assertEqual(config["responseSchema"].type, "ARRAY")
+
+    def test_exam_specifications(self):
+        config = self.to_vertex(structured_config(list[ExamSpecification]))
+        self.assertEqual(config["responseSchema"].type, "ARRAY")
+
+    def test_class_subject(self):
+        config = self.to_vertex(structured_config(ClassSubject))
+        self.assertEqual(config["responseSchema"].type, "OBJECT")
+
+
+if __name__ == "__main__":
+    unittest.main()
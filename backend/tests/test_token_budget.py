@@ -0,0 +1,64 @@
+import unittest
+
+from chat.token_budget import (
+    MIN_REFERENCE_TOKENS, REFERENCE_TOKENS_PER_QUESTION, estimate_tokens, fit_markdown, reference_budget,
+    retrieval_budget, split_sections,
+)
+
+
+def page(number, text, repeat=200):
+    return f"# Page Number: {number}\n" + (text + " ") * repeat + "\n"
+
+
+MARKDOWN = (
+    "Chapter : Light\n \n "
+    + page(1, "reflection of light by plane mirrors")
+    + page(2, "refraction through a glass slab and lenses")
+    + page(3, "dispersion of white light by a prism")
+)
+
+
+class TokenBudgetTest(unittest.TestCase):
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+    def test_split_sections(self):
+        sections = split_sections(MARKDOWN)
+        self.assertEqual(len(sections), 3)
+        self.assertTrue(all(chapter == "Chapter : Light\n \n " for chapter, _ in sections))
+        self.assertTrue(sections[1][1].startswith("# Page Number: 2"))
+
+    def test_markdown_within_budget_is_unchanged(self):
+        self.assertEqual(fit_markdown(MARKDOWN, estimate_tokens(MARKDOWN)), MARKDOWN)
+
+    def test_fit_keeps_the_most_relevant_pages(self):
+        budget = estimate_tokens(page(2, "refraction through a glass slab and lenses")) + 20
+        trimmed = fit_markdown(MARKDOWN, budget, query="refraction lenses")
+        self.assertLessEqual(estimate_tokens(trimmed), budget)
+        self.assertIn("# Page Number: 2", trimmed)
+        self.assertNotIn("# Page Number: 1", trimmed)
+        self.assertTrue(trimmed.startswith("Chapter : Light"))
+
+    def test_fit_keeps_document_order(self):
+        trimmed = fit_markdown(MARKDOWN, estimate_tokens(MARKDOWN) - 10, query="dispersion prism refraction")
+        self.assertLess(trimmed.index("# Page Number: 2"), trimmed.index("# Page Number: 3"))
+
+    def test_reference_budget(self):
+        config = {"type": "MCQ", "questions": 5}
+        self.assertGreater(reference_budget("gemini-2.5-flash", config), reference_budget("gemini-2.5-flash", config, "x" * 40000))
+        self.assertEqual(reference_budget("unknown-model", config, "x" * 1_000_000), MIN_REFERENCE_TOKENS)
+
+    def test_retrieval_budget_scales_with_the_section(self):
+        self.assertEqual(retrieval_budget("gemini-2.5-flash", {"type": "MCQ", "questions": 4}), 4 * REFERENCE_TOKENS_PER_QUESTION)
+        self.assertEqual(retrieval_budget("gemini-2.5-flash", {"type": "MCQ", "questions": 1}), max(REFERENCE_TOKENS_PER_QUESTION, MIN_REFERENCE_TOKENS))
+        self.assertEqual(
+            retrieval_budget("gemini-2.5-flash", {"type": "MCQ", "questions": 100}),
+            reference_budget("gemini-2.5-flash", {"type": "MCQ", "questions": 100}),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
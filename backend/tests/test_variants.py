@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from chat.variants import MAX_VARIANTS, NotEnoughVariants, make_variant, make_variants, shuffle_options, variant_capacity
+
+
+MCQ = {
+    "question": "How much is 1 + 1? [Marks 1]",
+    "options": {"a": "one", "b": "two", "c": "three", "d": "four"},
+    "answer": "b",
+    "reason": "Answer: b) two. Option a is too small and (c) too large.",
+}
+SUBJECTIVE = {"question": "Prove that 2 is prime. [Marks 3]", "answer": "It has no divisors other than 1 and 2."}
+SECTIONS = [
+    [dict(MCQ, question=f"Question {number} [Marks 1]") for number in range(6)],
+    [dict(SUBJECTIVE, question=f"Proof {number} [Marks 3]") for number in range(4)],
+]
+
+
+class ShuffleOptionsTest(unittest.TestCase):
+
+    def test_answer_and_reason_follow_their_option(self):
+        for seed in range(10):
+            shuffled = shuffle_options(MCQ, random.Random(seed))
+            with self.subTest(seed=seed):
+                self.assertEqual(sorted(shuffled["options"].values()), sorted(MCQ["options"].values()))
+                self.assertEqual(shuffled["options"][shuffled["answer"]], "two")
+                too_small = next(key for key, value in shuffled["options"].items() if value == "one")
+                too_large = next(key for key, value in shuffled["options"].items() if value == "three")
+                self.assertEqual(
+                    shuffled["reason"],
+                    f"Answer: {shuffled['answer']}) two. Option {too_small} is too small and ({too_large}) too large.",
+                )
+
+    def test_reason_text_that_is_not_an_option_is_kept(self):
+        question = dict(MCQ, reason="The answer is a prime number, as f(x) = (a + b) shows.")
+        self.assertEqual(shuffle_options(question, random.Random(1))["reason"], question["reason"])
+
+    def test_questions_without_options_are_unchanged(self):
+        self.assertIs(shuffle_options(SUBJECTIVE, random.Random(1)), SUBJECTIVE)
+
+
+class MakeVariantsTest(unittest.TestCase):
+
+    def test_same_seed_same_variant(self):
+        self.assertEqual(make_variant(SECTIONS, "job:A"), make_variant(SECTIONS, "job:A"))
+        self.assertNotEqual(make_variant(SECTIONS, "job:A"), make_variant(SECTIONS, "job:B"))
+
+    def test_sections_keep_their_questions(self):
+        variant = make_variant(SECTIONS, "job:A")
+        for original, shuffled in zip(SECTIONS, variant):
+            self.assertEqual(sorted(question["question"] for question in shuffled), sorted(question["question"] for question in original))
+
+    def test_input_is_not_modified(self):
+        before = [[dict(question) for question in section] for section in SECTIONS]
+        make_variants(SECTIONS, 3, "job")
+        self.assertEqual(SECTIONS, before)
+
+    def test_sets_are_different(self):
+        variants = make_variants(SECTIONS, MAX_VARIANTS, "job")
+        self.assertEqual(len({repr(sections) for _, sections in variants}), MAX_VARIANTS)
+
+    def test_small_paper_still_gets_different_sets(self):
+        small = [[SUBJECTIVE, dict(SUBJECTIVE, question="Prove that 3 is prime. [Marks 3]")]]
+        self.assertEqual(variant_capacity(small), 2)
+        for seed in range(20):
+            first, second = make_variants(small, 2, str(seed))
+            self.assertNotEqual(first[1], second[1])
+
+    def test_too_small_paper_is_refused(self):
+        with self.assertRaises(NotEnoughVariants):
+            make_variants([[SUBJECTIVE, dict(SUBJECTIVE, question="Prove that 3 is prime. [Marks 3]")]], 3, "job")
+        with self.assertRaises(NotEnoughVariants):
+            make_variants([[SUBJECTIVE, SUBJECTIVE]], 2, "job")
+
+    def test_labels_and_count(self):
+        self.assertEqual([label for label, _ in make_variants(SECTIONS, 3, "job")], ["A", "B", "C"])
+        self.assertEqual(len(make_variants(SECTIONS, MAX_VARIANTS + 5, "job")), MAX_VARIANTS)
+
+
+if __name__ == "__main__":
+    unittest.main()